@@ -145,7 +145,7 @@ def imGradSobel(img):
     using the Sobel operator to calculate the image gradient.
     """
     newImage = np.copy(img)
-    newImage = np.lib.pad(newImage, ((1, 1),), 'reflect')
+    newImage = np.pad(newImage, ((1, 1),), 'reflect')
     N = np.copy(newImage)
     Gx = np.zeros(img.shape, dtype=int)
     Gy = np.zeros(img.shape, dtype=int)
@@ -1,6 +1,9 @@
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
 import numpy as np
 import ex3Utils
-from numpy.matlib import repmat
 
 
 # Task 1:
@@ -56,39 +59,161 @@ def HoughCircles(imageEdges, radius, votesThresh, distThresh):
 
 
 # Task 2:
-def bilateralFilter(imgNoisy, spatial_std, range_std):
+def bilateralFilter(imgNoisy, spatial_std, range_std, numOfWorkers=1,
+                    tileRows=None):
     """
     Implement Bilateral Filter
+    Results may differ from a per pixel sum by 1 gray level after the
+    truncation to int.
     :param imgNoisy: image with noise
     :param spatial_std: sigma s
     :param range_std: sigma r
+    :param numOfWorkers: number of processes to split the image rows between,
+    1 filters the whole image in the calling process
+    :param tileRows: number of rows in each tile (without the halo), by default
+    every worker gets about 4 tiles
     :return: image that is a result of applying bilateral filter
     """
     M, N = imgNoisy.shape
     imgNoisy = np.asarray(imgNoisy, dtype=float)
-    newImg = np.zeros(imgNoisy.shape)
     sigma = int(spatial_std * 3)  # further than that has no influence
     # create kernel to screen image, instead of going over non-influence pixels
     kernel = getKernel(sigma)
     weights = getWeights(kernel, spatial_std)
 
-    for p in np.ndindex(imgNoisy.shape):
-        # finding coordinates of surrounding pixels using kernel
-        kernelCoordinates = np.int32(repmat([p], kernel.shape[0], 1) + kernel)
-        ys, xs = getXsAndYsFrom(kernelCoordinates, M, N)
-        # calculate Wpq according to bilateral formula
-        Iq = imgNoisy[(ys, xs)]
-        Ip = imgNoisy[p]
-        tempWs = (Ip - Iq) ** 2
-        tempWs = np.exp(-tempWs / (2 * range_std ** 2))
-        tempWs = tempWs / tempWs.sum()
-        W = weights * tempWs
-        # calculate new gray value
-        newImg[p] = np.sum(W * Iq) / np.sum(W)
-    newImg = np.asarray(newImg, dtype=int)
+    if numOfWorkers <= 1:
+        # pad once by replicating the border, same as clipping the coordinates
+        imgPad = np.pad(imgNoisy, sigma, 'edge')
+        newImg = bilateralTile(imgPad, sigma, kernel, weights, range_std)
+        return np.asarray(newImg, dtype=int)
+
+    if tileRows is None:
+        tileRows = max(1, int(np.ceil(M / (4.0 * numOfWorkers))))
+    newImg = np.empty((M, N), dtype=int)
+
+    # the padded input and the output live in shared memory, workers attach
+    # to them by name instead of getting pickled copies of the image
+    inShm = shared_memory.SharedMemory(create=True,
+                                       size=(M + 2 * sigma) * (N + 2 * sigma) * 8)
+    outShm = shared_memory.SharedMemory(create=True, size=newImg.nbytes)
+    try:
+        imgPad = np.ndarray((M + 2 * sigma, N + 2 * sigma), dtype=float,
+                            buffer=inShm.buf)
+        imgPad[:] = np.pad(imgNoisy, sigma, 'edge')
+        tiles = [(inShm.name, outShm.name, (M, N), sigma, kernel, weights,
+                  range_std, r0, min(r0 + tileRows, M))
+                 for r0 in range(0, M, tileRows)]
+        with multiprocessing.Pool(numOfWorkers) as pool:
+            pool.map(_bilateralTileWorker, tiles)
+        # stitch: the workers already wrote their rows into the output
+        newImg[:] = np.ndarray((M, N), dtype=int, buffer=outShm.buf)
+        del imgPad
+    finally:
+        inShm.close()
+        inShm.unlink()
+        outShm.close()
+        outShm.unlink()
     return newImg
 
 
+def _bilateralTileWorker(args):
+    inName, outName, shape, sigma, kernel, weights, range_std, r0, r1 = args
+    M, N = shape
+    inShm = shared_memory.SharedMemory(name=inName)
+    outShm = shared_memory.SharedMemory(name=outName)
+    try:
+        imgPad = np.ndarray((M + 2 * sigma, N + 2 * sigma), dtype=float,
+                            buffer=inShm.buf)
+        newImg = np.ndarray((M, N), dtype=int, buffer=outShm.buf)
+        # rows r0..r1 of the image plus a halo of sigma rows on each side
+        tile = imgPad[r0:r1 + 2 * sigma]
+        newImg[r0:r1] = bilateralTile(tile, sigma, kernel, weights, range_std)
+        del imgPad, newImg, tile
+    finally:
+        inShm.close()
+        outShm.close()
+
+
+def bilateralTile(imgPad, sigma, kernel, weights, range_std):
+    """
+    filter an image that was padded with sigma pixels on every side.
+    instead of going pixel by pixel, every kernel offset is handled at once
+    for the whole tile using a shifted view of the padded image
+    :return: float image the size of imgPad without the padding
+    """
+    views = getShiftedViews(imgPad, kernel, sigma)
+    # the center view is the unshifted image
+    return applyBilateralWeights(views[len(views) // 2], views, weights,
+                                 range_std)
+
+
+def getShiftedViews(imgPad, kernel, padding):
+    # view of the padded image for every kernel offset, aligned so that
+    # views[i][y, x] is the i-th neighbour of pixel (y, x)
+    M = imgPad.shape[0] - 2 * padding
+    N = imgPad.shape[1] - 2 * padding
+    offsets = np.int32(kernel) + padding
+    return [imgPad[dy:dy + M, dx:dx + N] for dy, dx in offsets]
+
+
+def applyBilateralWeights(Ip, views, weights, range_std):
+    # sum of W * Iq and of W over all the neighbours, where W is the spatial
+    # weight times the range weight of each neighbour
+    numerator = np.zeros(Ip.shape)
+    denominator = np.zeros(Ip.shape)
+    W = np.empty(Ip.shape)
+    for Iq, w in zip(views, weights):
+        np.subtract(Ip, Iq, out=W)
+        np.square(W, out=W)
+        W /= -(2 * range_std ** 2)
+        np.exp(W, out=W)
+        W *= w
+        denominator += W
+        W *= Iq
+        numerator += W
+    return numerator / denominator
+
+
+def bilateralSweep(imgNoisy, params, numOfWorkers=4):
+    """
+    Apply the bilateral filter with many (spatial_std, range_std) settings to
+    the same image. The padded image, the shifted neighbour views and the
+    spatial kernels are computed once and shared by all the settings, and
+    the settings run concurrently on a thread pool.
+    :param imgNoisy: image with noise
+    :param params: iterable of (spatial_std, range_std) pairs
+    :param numOfWorkers: number of settings to filter at the same time
+    :return: generator of (spatial_std, range_std, filtered image), yielded
+    as soon as each setting is done (not necessarily in the order of params)
+    """
+    params = list(params)
+    if not params:
+        return
+    imgNoisy = np.asarray(imgNoisy, dtype=float)
+    maxSigma = max(int(s * 3) for s, _ in params)
+    imgPad = np.pad(imgNoisy, maxSigma, 'edge')
+
+    # views and weights only depend on the spatial std
+    views = {}
+    weights = {}
+    for s, _ in params:
+        if s not in views:
+            kernel = getKernel(int(s * 3))
+            views[s] = getShiftedViews(imgPad, kernel, maxSigma)
+            weights[s] = getWeights(kernel, s)
+    # every set of views has the unshifted image in its middle
+    Ip = views[params[0][0]][len(views[params[0][0]]) // 2]
+
+    def filterSetting(s, r):
+        newImg = applyBilateralWeights(Ip, views[s], weights[s], r)
+        return s, r, np.asarray(newImg, dtype=int)
+
+    with ThreadPoolExecutor(numOfWorkers) as executor:
+        futures = [executor.submit(filterSetting, s, r) for s, r in params]
+        for future in as_completed(futures):
+            yield future.result()
+
+
 def getWeights(kernel, spatial_std):
     # each surrounding pixel has a different weight according to it's distance
     tempW = np.abs(np.sum(kernel ** 2, 1))
@@ -109,12 +234,3 @@ def getKernel(sigma):
     kernel = np.vstack((Ys.flatten(), Xs.flatten())).T
     return kernel
 
-
-def getXsAndYsFrom(kernelCoordinates, yBound, xBound):
-    ys = kernelCoordinates[:, 0]
-    xs = kernelCoordinates[:, 1]
-    ys[ys < 0] = 0
-    ys[ys > yBound - 1] = yBound - 1
-    xs[xs < 0] = 0
-    xs[xs > xBound - 1] = xBound - 1
-    return ys, xs
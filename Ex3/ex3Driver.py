@@ -85,19 +85,21 @@ def plotToPdf():
     spatial_std = 1
     range_std = noiseStd * 255
 
-    titles = []
-    imgClean = []
-
+    params = []
     for s in {0.25, 0.5, 1, 1.5}:
-        r = range_std * 100
-        imgClean.append(ex3.bilateralFilter(imgNoisy, s, r))
-        titles.append(
-            'spatial std = ' + str(s) + '\n range std = ' + str(r))
-
+        params.append((s, range_std * 100))
     for i in {1, 50, 100, 150}:
-        s = spatial_std
-        r = range_std * float(i)
-        imgClean.append(ex3.bilateralFilter(imgNoisy, s, r))
+        params.append((spatial_std, range_std * float(i)))
+
+    # all the settings share the same noisy image, so filter them in one sweep
+    results = {}
+    for s, r, filtered in ex3.bilateralSweep(imgNoisy, params):
+        results[(s, r)] = filtered
+
+    titles = []
+    imgClean = []
+    for s, r in params:
+        imgClean.append(results[(s, r)])
         titles.append(
             'spatial std = ' + str(s) + '\n range std = ' + str(r))
 
@@ -2,9 +2,10 @@
 # ex3 utils
 
 import numpy as np
-from  scipy.spatial.distance import cdist as cdist
 
 def selectLocalMaxima (circles,votesThresh,distThresh):
+    # scipy is imported only when it is used, importing ex3 stays cheap
+    from scipy.spatial.distance import cdist
     circles = circles[np.argsort(-circles[:, 3]),:]
     
     circlesClean = np.empty((1,4),dtype=np.float32)
@@ -1,55 +1,30 @@
+import os
+import sys
+from collections import OrderedDict
+
 import numpy as np
+import ex4Fft
+
+# the filters WienerDeconvolver keeps for reuse take at most this many bytes
+FILTER_CACHE_BYTES = 64 * 2 ** 20
 
 
 # Task 2
 # a
 def Fourier1D(Xn):
-    n = len(Xn)
-    XnFourier = np.ndarray(n, complex)
-
-    # vector of the powers of the exponent
-    exponents = np.repeat(-2.0 / n, n)
-    XnIndices = np.arange(n)
-    exponents = np.multiply(exponents, XnIndices)
-
-    # with each iteration fills an element of the transformed vector
-    for k in np.arange(0, n):
-        # each element is the result of cos/sin of the exponent,
-        # and transformed the sin values to be imaginary
-        realVals = np.cos(np.multiply(exponents, np.pi * k))
-        imagVals = np.sin(np.multiply(exponents, np.pi * k))
-        imagVals = np.multiply(imagVals, 1j)
-
-        realVals = np.multiply(Xn, realVals)
-        imagVals = np.multiply(Xn, imagVals)
-
-        XnFourier[k] = np.sum(realVals) + np.sum(imagVals)
-
-    return XnFourier
+    """
+    discrete fourier transform of a 1D signal (or of every row of a 2D array)
+    using the fast transform from ex4Fft
+    """
+    return ex4Fft.fft(Xn)
 
 # b
 def invFourier1D(Fn):
-    n = len(Fn)
-    XnInvFourier = np.ndarray(n, complex)
-
-    # vector of the powers of the exponent
-    exponents = np.repeat(np.pi * 2 / n, n)
-    exponents = np.multiply(exponents, np.arange(n))
-
-    # with each iteration fills an element of the 'original' vector
-    for x in np.arange(0, n):
-        # each element is the result of cos/sin on the exponent,
-        # transformed the sin values to be imaginary
-        cosVals = np.cos(np.multiply(exponents, x))
-        sinVals = np.sin(np.multiply(exponents, x))
-        sinVals = np.multiply(sinVals, 1j)
-
-        cosVals = np.multiply(Fn, cosVals)
-        sinVals = np.multiply(Fn, sinVals)
-
-        XnInvFourier[x] = np.divide(np.sum(cosVals) + np.sum(sinVals), n)
-
-    return XnInvFourier
+    """
+    inverse discrete fourier transform of a 1D signal (or of every row of a
+    2D array) using the fast transform from ex4Fft
+    """
+    return ex4Fft.fft(Fn, inverse=True)
 
 def cartesianToPolar(cartesian):
     real = np.real(cartesian)
@@ -58,13 +33,14 @@ def cartesianToPolar(cartesian):
     R = np.sqrt(np.power(real, 2) + np.power(imag, 2))
     theta = np.arctan2(imag, real)
 
-    polar = np.column_stack((R, theta))
+    # last axis holds (R, theta), so batches of signals keep their rows
+    polar = np.stack((R, theta), axis=-1)
 
     return polar
 
 def polarToCartes(polar):
-    R = polar[:, 0]
-    t = polar[:, 1]
+    R = polar[..., 0]
+    t = polar[..., 1]
     a = R * np.cos(t)
     b = R * np.sin(t)
 
@@ -106,7 +82,7 @@ def imageUpsampling(img, upsamplingFactor):
     padWidth = np.array(((shape * upsamplingFactor) - shape) / 2.0, dtype=int)
     _, padWidth = np.meshgrid(padWidth, padWidth)
 
-    zeroPaddedFFT = np.lib.pad(shiftFFT, padWidth, 'constant')
+    zeroPaddedFFT = np.pad(shiftFFT, padWidth, 'constant')
     zeroPaddedFFT *= (upsamplingFactor[0] * upsamplingFactor[1])
 
     # Shift the High frequency components to the center and Low frequency components outside.
@@ -117,19 +93,100 @@ def imageUpsampling(img, upsamplingFactor):
     return upsampledImg, shiftFFT, zeroPaddedFFT
 
 
+def upsampleImage(img, upsamplingFactor, useComplex64=False, out=None,
+                  stripSize=64):
+    """
+    Memory bounded version of imageUpsampling, for large images and stacks.
+    The quadrants of the rfft2 half spectrum are written straight into one
+    preallocated zero-padded half spectrum (no shifts or padded copies), which
+    is then inverted in place one strip at a time.
+    The output size is round(size * factor), rounded up to a fast FFT size, so
+    factors don't have to be integers.
+    Memory at the target size is the output plus the padded half spectrum,
+    about 2 * target pixels * 4 bytes with useComplex64 (8 bytes otherwise),
+    plus strips of stripSize rows/columns. Upsampling 3840x2160 by 4 to
+    15360x8640 takes about 1.1 GB in single precision.
+    :param img: 2D image, or a stack of images along the first axis
+    :param upsamplingFactor: 2D vector with the upscaling parameters (larger
+    than 1) at each dimension, like imageUpsampling the original image is
+    returned when one of them is < 1
+    :param useComplex64: compute in single precision
+    :param out: preallocated output (or np.memmap) of the upsampled shape
+    :param stripSize: number of rows/columns inverted at a time
+    :return: the upsampled image(s)
+    """
+    img = np.asarray(img)
+    if (np.asarray(upsamplingFactor) < 1).any():
+        if out is None:
+            return img
+        out[...] = img
+        return out
+    rows, cols = img.shape[-2:]
+    newRows = ex4Fft.nextFastLen(int(round(rows * upsamplingFactor[0])))
+    newCols = ex4Fft.nextFastLen(int(round(cols * upsamplingFactor[1])))
+    realType = np.float32 if useComplex64 else float
+    complexType = np.complex64 if useComplex64 else complex
+    if out is None:
+        out = np.empty(img.shape[:-2] + (newRows, newCols), dtype=realType)
+
+    padded = np.empty((newRows, newCols // 2 + 1), dtype=complexType)
+    frames = img.reshape(-1, rows, cols)
+    outFrames = out.reshape(-1, newRows, newCols)
+    for frame, outFrame in zip(frames, outFrames):
+        placeSpectrum(np.fft.rfft2(np.asarray(frame, dtype=realType)), padded,
+                      rows, cols, newCols)
+        # keep the intensities, the transform of the larger image sums
+        # newRows * newCols pixels instead of rows * cols
+        padded *= (newRows * newCols) / float(rows * cols)
+
+        # inverse transform of the columns, only the first cols / 2 + 1
+        # columns are not zero
+        for c0 in range(0, cols // 2 + 1, stripSize):
+            c1 = min(c0 + stripSize, cols // 2 + 1)
+            padded[:, c0:c1] = np.fft.ifft(padded[:, c0:c1], axis=0)
+        # and of the rows, straight into the output
+        for r0 in range(0, newRows, stripSize):
+            r1 = min(r0 + stripSize, newRows)
+            outFrame[r0:r1] = np.abs(np.fft.irfft(padded[r0:r1], newCols,
+                                                  axis=1))
+    return out
+
+
+def placeSpectrum(half, padded, rows, cols, newCols):
+    # zero padding of an rfft2 half spectrum: the positive row frequencies go
+    # to the top, the negative ones to the bottom. the Nyquist row and column
+    # of even sizes that are enlarged belong to both the positive and the
+    # negative side, so each side gets half of them. an axis that keeps its
+    # size keeps its Nyquist frequency as it is
+    padded[:] = 0
+    top = (rows + 1) // 2
+    bottom = rows // 2
+    halfCols = cols // 2 + 1
+    padded[:top, :halfCols] = half[:top]
+    padded[padded.shape[0] - bottom:, :halfCols] = half[rows - bottom:]
+    if rows % 2 == 0 and padded.shape[0] > rows:
+        padded[padded.shape[0] - bottom] *= 0.5
+        padded[bottom] = padded[padded.shape[0] - bottom]
+    if cols % 2 == 0 and newCols > cols:
+        padded[:, halfCols - 1] *= 0.5
+
+
 # Task 4
-def phaseCorr(ga, gb):
+def phaseCorr(ga, gb, useComplex64=False):
     """
     Implement an algorithm that finds a translation between two images sampled from an original
     image. this, implement the phase-correlation algorithm which use the frequency domain to find
     the translation in x, y between two images.
     :param ga: first image to find correlation
     :param gb: second image to find correlation
+    :param useComplex64: compute the transforms in single precision
     :return: the translation
     """
     # Calculate the discrete 2D Fourier transform of both images.
-    Ga = np.fft.fft2(ga)
-    Gb = np.fft.fft2(gb)
+    # the images are real, so only half of the spectrum is needed
+    dtype = np.float32 if useComplex64 else float
+    Ga = np.fft.rfft2(np.asarray(ga, dtype=dtype))
+    Gb = np.fft.rfft2(np.asarray(gb, dtype=dtype))
 
     # Complex conjugate of the second result
     GbStar = np.conjugate(Gb)
@@ -138,10 +195,10 @@ def phaseCorr(ga, gb):
     tmp = Ga * GbStar
 
     # Normalizing the product
-    R = tmp / np.abs(tmp)
+    R = normalizeCrossPower(tmp)
 
     # Normalized cross-correlation by applying the inverse Fourier transform.
-    r = np.fft.ifft2(R)
+    r = np.fft.irfft2(R, s=np.shape(ga))
 
     # Determine the location of the peak in r.
     index = np.argmax(r)
@@ -150,9 +207,191 @@ def phaseCorr(ga, gb):
     return x, y, r
 
 
+def pyramidPhaseCorr(ga, gb, numOfLevels=4, filterParam=0.4, windowSize=64):
+    """
+    Coarse to fine phase correlation for large images: the translation is found
+    by phaseCorr on the coarsest level of the Gaussian pyramids of both images,
+    and on every finer level it is doubled and refined by phaseCorr on small
+    windows cropped around the predicted offset.
+    Building a pyramid costs about as much as half a full size phaseCorr, so
+    when many frames are registered against one reference, build its pyramid
+    once and pass it instead of the image: every call then builds only the
+    pyramid of the frame.
+    :param ga: first image to find correlation, or its Gaussian pyramid
+    (gaussianPyramid, LazyPyramid or a dict of levels of ex5)
+    :param gb: second image to find correlation, or its Gaussian pyramid
+    :param numOfLevels: number of pyramid levels, the coarsest is reduced by
+    2^(numOfLevels - 1). given pyramids need at least that many levels
+    :param filterParam: parameter of the pyramid's filter
+    :param windowSize: size of the windows used to refine the finer levels
+    :return: the translation x, y, modulo the image size like phaseCorr
+    """
+    ex5 = importEx5()
+    Pa = gaussianLevels(ex5, ga, numOfLevels, filterParam)
+    Pb = gaussianLevels(ex5, gb, numOfLevels, filterParam)
+
+    top = numOfLevels - 1
+    a, b = Pa[top], Pb[top]
+    x, y, _ = phaseCorr(a, b)
+    # the translation is only known modulo the size, (x, y) and (x - width,
+    # y - height) give the same peak. take the one where the images agree best
+    candidates = [(tx, ty) for tx in (x, x - a.shape[1])
+                  for ty in (y, y - a.shape[0])]
+    tx, ty = max(candidates, key=lambda t: overlapCorrelation(a, b, t[0], t[1]))
+
+    for level in range(top - 1, -1, -1):
+        # the translation in pixels of this level
+        tx, ty = 2 * tx, 2 * ty
+        windows = cropOverlap(Pa[level], Pb[level], tx, ty, windowSize)
+        if windows is None:
+            continue
+        # taper the windows so their borders don't correlate
+        wa, wb = windows
+        hann = np.outer(np.hanning(wa.shape[0]), np.hanning(wa.shape[1]))
+        x, y, _ = phaseCorr(wa * hann, wb * hann)
+        tx += signedShift(x, wa.shape[1])
+        ty += signedShift(y, wa.shape[0])
+    return tx % Pa[0].shape[1], ty % Pa[0].shape[0]
+
+
+def gaussianLevels(ex5, g, numOfLevels, filterParam):
+    # a pyramid (anything indexed by level) is used as it is
+    if isinstance(g, (ex5.Pyramid, ex5.LazyPyramid, dict)):
+        return g
+    return ex5.gaussianPyramid(g, numOfLevels, filterParam)
+
+
+def importEx5():
+    # gaussianPyramid is part of ex5, in the directory next to this one
+    ex5Dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, 'Ex5')
+    if ex5Dir not in sys.path:
+        sys.path.append(ex5Dir)
+    import ex5
+    return ex5
+
+
+def signedShift(shift, size):
+    # phaseCorr translations are modulo the size, take the one closest to 0
+    return shift - size if shift > size / 2 else shift
+
+
+def overlapCorrelation(a, b, tx, ty):
+    # correlation coefficient of a and b on their overlap for translation t
+    windows = cropOverlap(a, b, tx, ty, max(a.shape))
+    if windows is None:
+        return -np.inf
+    wa, wb = windows
+    wa = wa - wa.mean()
+    wb = wb - wb.mean()
+    norm = np.sqrt(np.sum(wa ** 2) * np.sum(wb ** 2))
+    return np.sum(wa * wb) / norm if norm > 0 else -np.inf
+
+
+def cropOverlap(a, b, tx, ty, windowSize):
+    # windows of a and of b (moved by the translation) around the center of
+    # the area where the images overlap, a(p) ~ b(p - t)
+    y0, x0 = max(0, ty), max(0, tx)
+    y1 = min(a.shape[0], b.shape[0] + ty)
+    x1 = min(a.shape[1], b.shape[1] + tx)
+    h, w = min(windowSize, y1 - y0), min(windowSize, x1 - x0)
+    if h < 2 or w < 2:
+        return None
+    y0 += (y1 - y0 - h) // 2
+    x0 += (x1 - x0 - w) // 2
+    return (a[y0:y0 + h, x0:x0 + w],
+            b[y0 - ty:y0 - ty + h, x0 - tx:x0 - tx + w])
+
+
+def normalizeCrossPower(tmp):
+    # tmp / |tmp|, frequencies where both spectra vanish stay 0 instead of
+    # turning into NaN
+    magnitude = np.abs(tmp)
+    return np.divide(tmp, magnitude, out=np.zeros_like(tmp),
+                     where=magnitude > 0)
+
+
+class PhaseCorrRegistrar:
+    """
+    Register many frames against one fixed reference image with phase
+    correlation. The conjugated spectrum of the reference is computed once.
+    Without the window and the sub-pixel refinement, register() gives the same
+    translation as phaseCorr(frame, reference).
+    """
+
+    def __init__(self, reference, window=False, subPixel=True,
+                 useComplex64=False):
+        """
+        :param reference: the fixed image every frame is registered against
+        :param window: multiply the reference and the frames by a 2D Hann
+        window, which reduces the effect of the image borders
+        :param subPixel: refine the peak from its neighbours in each direction
+        :param useComplex64: compute the transforms in single precision
+        """
+        self.dtype = np.float32 if useComplex64 else float
+        self.shape = np.shape(reference)
+        self.subPixel = subPixel
+        self.window = None
+        if window:
+            self.window = np.outer(np.hanning(self.shape[0]),
+                                   np.hanning(self.shape[1])).astype(self.dtype)
+        self.refStar = np.conjugate(np.fft.rfft2(self.prepare(reference)))
+
+    def prepare(self, images):
+        images = np.asarray(images, dtype=self.dtype)
+        if self.window is not None:
+            images = images * self.window
+        return images
+
+    def register(self, frames):
+        """
+        :param frames: single (H, W) frame, or (N, H, W) stack of frames which
+        are all transformed in one batched FFT
+        :return: the translation x, y of the frame (arrays of N translations
+        for a stack)
+        """
+        frames = self.prepare(frames)
+        Gs = np.fft.rfft2(frames)
+        Gs *= self.refStar
+        r = np.fft.irfft2(normalizeCrossPower(Gs), s=self.shape)
+
+        # peak of every correlation surface
+        stack = r.reshape(-1, self.shape[0] * self.shape[1])
+        index = np.argmax(stack, axis=1)
+        ys, xs = np.unravel_index(index, self.shape)
+        xs = xs.astype(float)
+        ys = ys.astype(float)
+        if self.subPixel:
+            rows = stack.reshape(-1, self.shape[0], self.shape[1])
+            frameIdx = np.arange(rows.shape[0])
+            iy, ix = ys.astype(int), xs.astype(int)
+            # neighbours wrap around, like the translation itself
+            ys += peakOffset(rows[frameIdx, (iy - 1) % self.shape[0], ix],
+                             rows[frameIdx, iy, ix],
+                             rows[frameIdx, (iy + 1) % self.shape[0], ix])
+            xs += peakOffset(rows[frameIdx, iy, (ix - 1) % self.shape[1]],
+                             rows[frameIdx, iy, ix],
+                             rows[frameIdx, iy, (ix + 1) % self.shape[1]])
+        if frames.ndim == 2:
+            return xs[0], ys[0]
+        return xs, ys
+
+
+def peakOffset(before, peak, after):
+    # the phase correlation peak of a sub-pixel translation is a sampled sinc,
+    # its center is estimated from the peak and its larger neighbour
+    # (Foroosh, Zerubia & Berthod 2002)
+    right = after > before
+    neighbour = np.where(right, after, before)
+    offset = np.divide(neighbour, neighbour + peak, out=np.zeros(np.shape(peak)),
+                       where=(neighbour + peak) != 0)
+    return np.where(right, offset, -offset)
+
+
 # Task 5
 # a
-def imFreqFilter(img, lowThresh, highThresh):
+def imFreqFilter(img, lowThresh, highThresh, useComplex64=False,
+                 fullSpectrum=True):
     """
     Implement a band-pass filtering function, that allow both high-pass, low-pass and band-pass
     filtering in the frequency domain.
@@ -162,50 +401,280 @@ def imFreqFilter(img, lowThresh, highThresh):
     :param img: the original image
     :param lowThresh: the low-pass threshold
     :param highThresh: the high-pass threshold
+    :param useComplex64: compute the transforms in single precision
+    :param fullSpectrum: return the Fourier img and the mask as full, centered
+    spectra. if False they are returned in the half spectrum layout of rfft2
     :return: filtered Image, Fourier img, mask
     """
-    Fimg = np.fft.fftshift(np.fft.fft2(img))
-    H = np.zeros(Fimg.shape)
-
-    # create martrix of distance from center
-    xBound, yBound = H.shape
-    xTmp = np.linspace(0, xBound - 1, xBound) - xBound / 2.0
-    yTmp = np.linspace(0, yBound - 1, yBound) - yBound / 2.0
-    us, vs = np.meshgrid(xTmp, yTmp)
-    distanceMatrix = np.sqrt(us ** 2 + vs ** 2)
+    # the image is real, so only half of the spectrum is needed
+    dtype = np.float32 if useComplex64 else float
+    Fimg = np.fft.rfft2(np.asarray(img, dtype=dtype))
 
-    # applying pass function over distance
-    H[np.logical_and(lowThresh <= distanceMatrix, distanceMatrix <= highThresh)] = 1
+    # pass function over the distance from the zero frequency, in the half
+    # spectrum layout. nothing is kept, a FreqFilterBank keeps the masks for
+    # filtering many images
+    xBound, yBound = np.shape(img)
+    bank = FreqFilterBank()
+    H = bank.bandPass(bank.distance((xBound, yBound)), lowThresh, highThresh)
 
     # applying mask over image
-    filteredImg = np.abs(np.fft.ifft2(Fimg * H))
+    filteredImg = np.abs(np.fft.irfft2(Fimg * H, s=(xBound, yBound)))
 
+    if fullSpectrum:
+        Fimg = np.fft.fftshift(halfToFullSpectrum(Fimg, yBound))
+        H = np.fft.fftshift(halfToFullSpectrum(H, yBound))
     return filteredImg, Fimg, H
 
+
+def halfToFullSpectrum(half, cols):
+    """
+    rebuild the full spectrum of a real image from its rfft2 half spectrum,
+    using F(-u, -v) = conj(F(u, v))
+    :param half: half spectrum, rfft2 layout
+    :param cols: number of columns of the full spectrum
+    """
+    rows = half.shape[0]
+    full = np.empty((rows, cols), dtype=half.dtype)
+    full[:, :half.shape[1]] = half
+    missing = np.arange(half.shape[1], cols)
+    flippedRows = -np.arange(rows) % rows
+    full[:, missing] = np.conjugate(half[flippedRows][:, cols - missing])
+    return full
+
+
+class FreqFilterBank:
+    """
+    Band-pass masks for imFreqFilter, kept for reuse when filtering many
+    images of the same shape. The distance map of every shape is built once,
+    and every (shape, low, high, profile) mask is built once and stored as
+    float32 in the rfft2 half spectrum layout, so filtering an image costs one
+    multiply and two transforms.
+    profiles:
+    'ideal' - 1 between the thresholds and 0 elsewhere (like imFreqFilter)
+    'butterworth' - smooth edges of the given order, less ringing
+    'gaussian' - difference of Gaussians like band, no ringing at all
+    """
+
+    def __init__(self, order=2):
+        """
+        :param order: order of the butterworth profile
+        """
+        self.order = order
+        self.distances = {}
+        self.masks = {}
+
+    def distance(self, shape):
+        # distance of every frequency from the zero frequency, rows are
+        # 0..M/2, -M/2..-1 and columns are 0..N/2
+        shape = tuple(shape)
+        if shape not in self.distances:
+            us = np.fft.fftfreq(shape[0]) * shape[0]
+            vs = np.fft.rfftfreq(shape[1]) * shape[1]
+            self.distances[shape] = np.sqrt(
+                us[:, np.newaxis] ** 2 + vs ** 2).astype(np.float32)
+        return self.distances[shape]
+
+    def mask(self, shape, lowThresh, highThresh, profile='ideal'):
+        """
+        :param shape: shape of the images (not of the half spectrum)
+        :param lowThresh: the low-pass threshold, 0 for low-pass filtering
+        :param highThresh: the high-pass threshold
+        :param profile: 'ideal', 'butterworth' or 'gaussian'
+        :return: float32 mask in the rfft2 half spectrum layout
+        """
+        key = (tuple(shape), lowThresh, highThresh, profile)
+        if key in self.masks:
+            return self.masks[key]
+        H = self.bandPass(self.distance(shape), lowThresh, highThresh, profile)
+        # shared by every caller, so nobody may change it
+        H.flags.writeable = False
+        self.masks[key] = H
+        return H
+
+    def bandPass(self, d, lowThresh, highThresh, profile='ideal'):
+        """
+        :param d: distances from the zero frequency
+        :return: float32 band-pass profile at those distances
+        """
+        if profile == 'ideal':
+            H = np.logical_and(lowThresh <= d, d <= highThresh)
+        elif profile == 'butterworth':
+            n = 2 * self.order
+            with np.errstate(divide='ignore', over='ignore'):
+                H = 1 / (1 + (d / highThresh) ** n)
+                if lowThresh > 0:
+                    H *= 1 - 1 / (1 + (d / lowThresh) ** n)
+        elif profile == 'gaussian':
+            H = np.exp(-d ** 2 / (2.0 * highThresh ** 2))
+            if lowThresh > 0:
+                H *= 1 - np.exp(-d ** 2 / (2.0 * lowThresh ** 2))
+        else:
+            raise ValueError('unknown profile: ' + str(profile))
+        return np.asarray(H, dtype=np.float32)
+
+    def apply(self, images, lowThresh, highThresh, profile='ideal'):
+        """
+        filter an image, or a stack of images along the first axis
+        :return: the filtered images, like the first output of imFreqFilter
+        """
+        images = np.asarray(images)
+        shape = images.shape[-2:]
+        H = self.mask(shape, lowThresh, highThresh, profile)
+        F = np.fft.rfft2(images)
+        F *= H
+        return np.abs(np.fft.irfft2(F, s=shape))
+
+    def clear(self):
+        self.distances.clear()
+        self.masks.clear()
+
+
 # d
-def imageDeconv(G, H, k):
+def imageDeconv(G, H, k, useComplex64=False):
     """
     Implement the Weiner filter for image restoration.
     :param G: the degraded image
     :param H: the convolution kernel used to degrade the image
     :param k: the lambda parameter to avoid dividing by zero
+    :param useComplex64: compute the transforms in single precision
     :return: the restored image
     """
-    # frequency domain
-    FH = np.fft.fft2(H, G.shape)
-    FG = np.fft.fft2(G)
-
-    # calculating weiners formila
-    Hstar = np.conjugate(FH)
-    xBound, yBound = G.shape
-    Xs = np.linspace(0, xBound - 1, xBound)
-    Ys = np.linspace(1, yBound - 1, yBound)
-    us, vs = np.meshgrid(Xs, Ys)
-    tmp = Hstar * FH + k * (us ** 2 + vs ** 2)
-    F = (Hstar / tmp) * FG
-    Fspatial = np.fft.ifft2(F).real
-    # fix shift
-    kernelShape = H.shape
-    Fspatial = np.roll(Fspatial, int(kernelShape[0] / 2.0), 0)
-    Fspatial = np.roll(Fspatial, int(kernelShape[0] / 2.0), 1)
-    return Fspatial
+    return WienerDeconvolver(H, useComplex64).apply(G, k)
+
+
+def inverse(x):
+    # 1 / x, and 0 at the frequencies the kernel removes when k is 0, which
+    # can't be restored
+    res = np.zeros_like(x)
+    np.divide(1, x, out=res, where=x != 0)
+    return res
+
+
+def regCoordinates(n, size, flipped=False):
+    # the frequencies of an n point transform as indices 0..size - 1 of a
+    # size point transform, the coordinates of the Wiener regulariser.
+    # flipped gives the index of the mirrored frequency
+    if n == size:
+        indices = np.arange(n)
+        return -indices % n if flipped else indices
+    freqs = np.fft.fftfreq(n) * size
+    return (-freqs if flipped else freqs) % size
+
+
+def cacheBytes(value):
+    # bytes of an array, or of the arrays of a (nested) tuple
+    if isinstance(value, tuple):
+        return sum(cacheBytes(v) for v in value)
+    return value.nbytes
+
+
+class WienerDeconvolver:
+    """
+    Wiener filter for restoring many images degraded by the same kernel.
+    The filter conj(FH) / (|FH|^2 + k * reg) is built once per (image shape, k),
+    in the rfft2 half spectrum layout, and the most recently used filters and
+    kernel spectra are kept, so every image (or stack of images) costs one
+    spectrum multiply and two transforms.
+    """
+
+    def __init__(self, H, useComplex64=False, filterCacheBytes=FILTER_CACHE_BYTES):
+        """
+        :param H: the convolution kernel used to degrade the images
+        :param useComplex64: compute the transforms in single precision
+        :param filterCacheBytes: the filters and kernel spectra of the most
+        recently used (shape, k) are kept up to this many bytes (at least the
+        last one)
+        """
+        self.H = np.asarray(H)
+        self.dtype = np.float32 if useComplex64 else float
+        # filters and kernel spectra, the least recently used first
+        self.cache = OrderedDict()
+        self.filterCacheBytes = filterCacheBytes
+
+    def kernelSpectra(self, shape, imageShape=None):
+        """
+        conj(FH), |FH|^2 and the coordinates (us, vs) of the regulariser
+        us^2 + vs^2 on a grid of this shape, and of its mirror, where the
+        regulariser is in the frequency units of images of imageShape (the
+        grid's shape by default)
+        """
+        imageShape = tuple(imageShape or shape)
+        key = ('spectra', shape, imageShape)
+        spectra = self.cached(key)
+        if spectra is None:
+            FH = np.fft.rfft2(np.asarray(self.H, dtype=self.dtype), shape)
+            Hstar = np.conjugate(FH)
+            xBound, yBound = shape
+            Xs = regCoordinates(yBound, imageShape[1]).astype(self.dtype)
+            Ys = regCoordinates(xBound, imageShape[0]).astype(self.dtype)
+            # the regulariser is not symmetric in frequency, and the real part
+            # of the full inverse transform only keeps the symmetric part of
+            # the filter: average the filter at (u, v) with the one at the
+            # mirrored (-u, -v)
+            cols = FH.shape[1]
+            XsFlipped = regCoordinates(yBound, imageShape[1], True).astype(self.dtype)
+            YsFlipped = regCoordinates(xBound, imageShape[0], True).astype(self.dtype)
+            spectra = (Hstar, (Hstar * FH).real, (Xs[:cols], Ys[:, np.newaxis]),
+                       (XsFlipped[:cols], YsFlipped[:, np.newaxis]))
+            self.keep(key, spectra)
+        return spectra
+
+    def filter(self, shape, k, imageShape=None, cache=True):
+        """
+        :param imageShape: shape of the images the regulariser is scaled to,
+        for a filter sampled on a smaller grid (the grid's shape by default)
+        :param cache: keep the filter for the next call with the same
+        (shape, k)
+        :return: the Wiener filter for images of this shape, half spectrum
+        """
+        shape = tuple(shape)
+        key = ('filter', shape, k, imageShape and tuple(imageShape))
+        W = self.cached(key)
+        if W is not None:
+            return W
+        Hstar, power, (us, vs), (usFlipped, vsFlipped) = self.kernelSpectra(shape, imageShape)
+        W = Hstar * 0.5 * (inverse(power + k * (us ** 2 + vs ** 2)) +
+                           inverse(power + k * (usFlipped ** 2 + vsFlipped ** 2)))
+        if cache:
+            self.keep(key, W)
+        return W
+
+    def cached(self, key):
+        value = self.cache.get(key)
+        if value is not None:
+            self.cache.move_to_end(key)
+        return value
+
+    def keep(self, key, value):
+        self.cache[key] = value
+        # drop the least recently used entries until they fit the budget
+        total = sum(cacheBytes(v) for v in self.cache.values())
+        while total > self.filterCacheBytes and len(self.cache) > 1:
+            _, old = self.cache.popitem(last=False)
+            total -= cacheBytes(old)
+
+    def apply(self, G, k):
+        """
+        :param G: the degraded image, or a stack of images along the first axis
+        :param k: the lambda parameter to avoid dividing by zero
+        :return: the restored image(s)
+        """
+        FG = np.fft.rfft2(np.asarray(G, dtype=self.dtype))
+        return self.restore(FG, np.shape(G)[-2:], k)
+
+    def sweep(self, G, ks):
+        """
+        restore the same image(s) with several k values, G is transformed once.
+        the filters of the sweep are not kept, one is built for every k
+        :return: list of the restored images, one for every k
+        """
+        FG = np.fft.rfft2(np.asarray(G, dtype=self.dtype))
+        return [self.restore(FG, np.shape(G)[-2:], k, False) for k in ks]
+
+    def restore(self, FG, shape, k, cache=True):
+        Fspatial = np.fft.irfft2(FG * self.filter(shape, k, cache=cache), shape)
+        # fix shift
+        kernelShape = self.H.shape
+        Fspatial = np.roll(Fspatial, int(kernelShape[0] / 2.0), -2)
+        Fspatial = np.roll(Fspatial, int(kernelShape[0] / 2.0), -1)
+        return Fspatial
@@ -0,0 +1,105 @@
+# IMPR 2017, IDC
+# ex4 blocks - overlap-save convolution of images too large for one FFT
+
+import numpy as np
+
+import ex4
+from ex4Fft import nextFastLen
+
+# the tiles are read and dispatched like the tiles of ex5Tiles
+ex4.importEx5()
+from ex5Tiles import forTiles, readTile
+
+
+def blockConvolve(img, kernel, out=None, blockSize=1024, numOfThreads=1):
+    """
+    Convolve an image with a kernel block by block with the overlap-save method,
+    like convolve2d(img, kernel, mode='same') with zero borders.
+    Only one block with its halo is read and transformed at a time (per thread),
+    so img and out can be np.memmap arrays much larger than the memory.
+    :param img: 2D image (or np.memmap)
+    :param kernel: 2D convolution kernel
+    :param out: preallocated output the shape of img (or np.memmap), a new
+    float array by default
+    :param blockSize: approximate size of the output blocks, the FFT size is
+    rounded up to a fast 2^a * 3^b * 5^c size and the block grows to fill it
+    :param numOfThreads: number of blocks transformed at the same time
+    :return: out
+    """
+    kernel = np.asarray(kernel, dtype=float)
+    kh, kw = kernel.shape
+    # no larger than a single block holding the whole image
+    fftShape = (nextFastLen(min(blockSize, img.shape[0]) + kh - 1),
+                nextFastLen(min(blockSize, img.shape[1]) + kw - 1))
+    # output block size that uses the whole transform
+    bh, bw = fftShape[0] - kh + 1, fftShape[1] - kw + 1
+    kernelSpectrum = np.fft.rfft2(kernel, fftShape)
+    if out is None:
+        out = np.empty(img.shape)
+
+    # out[y] = sum of kernel[i] * img[y + center - i], so every block needs
+    # kh - 1 rows above it (shifted by the center) and kw - 1 columns left of it
+    cy, cx = (kh - 1) // 2, (kw - 1) // 2
+
+    def convolveBlock(corner):
+        y0, x0 = corner
+        y1, x1 = min(y0 + bh, img.shape[0]), min(x0 + bw, img.shape[1])
+        tile = readTile(img, y0 + cy - kh + 1, y1 + cy, x0 + cx - kw + 1, x1 + cx)
+        res = np.fft.irfft2(np.fft.rfft2(tile, fftShape) * kernelSpectrum,
+                            fftShape)
+        # the first kh - 1 rows and kw - 1 columns wrapped around, the rest is
+        # the linear convolution
+        out[y0:y1, x0:x1] = res[kh - 1:kh - 1 + y1 - y0, kw - 1:kw - 1 + x1 - x0]
+
+    forTiles(convolveBlock, img.shape, (bh, bw), numOfThreads)
+    return out
+
+
+def blockFreqFilter(img, lowThresh, highThresh, kernelSize=129,
+                    profile='gaussian', out=None, blockSize=1024, numOfThreads=1):
+    """
+    Block version of imFreqFilter for images too large for one FFT.
+    The band-pass mask (in the units of the whole image, like imFreqFilter) is
+    sampled on a kernelSize x kernelSize grid, and its inverse transform is used
+    as a spatial kernel for blockConvolve. The result is close to
+    FreqFilterBank().apply with the same profile, except for the borders (zero
+    instead of periodic) and a band edge that is only resolved to about
+    img.shape / kernelSize. That is why the default is the smooth 'gaussian'
+    profile: the sharp edge of 'ideal' (the profile of imFreqFilter) rings
+    all over the image unless kernelSize is about the size of the image.
+    :return: the filtered image (out)
+    """
+    # frequencies of the kernel grid, in the units of the whole image
+    rows, cols = img.shape
+    fu = np.fft.fftfreq(kernelSize) * rows
+    fv = np.fft.fftfreq(kernelSize) * cols
+    d = np.sqrt(fu[:, np.newaxis] ** 2 + fv ** 2)
+    H = ex4.FreqFilterBank().bandPass(d, lowThresh, highThresh, profile)
+    kernel = np.fft.fftshift(np.real(np.fft.ifft2(H)))
+    out = blockConvolve(img, kernel, out, blockSize, numOfThreads)
+    np.abs(out, out=out)
+    return out
+
+
+def blockDeconv(G, H, k, kernelSize=255, out=None, blockSize=1024,
+                numOfThreads=1):
+    """
+    Block version of imageDeconv for images too large for one FFT.
+    The Wiener filter is built on a kernelSize x kernelSize grid (with the
+    regulariser in the units of the whole image, so k means the same as in
+    imageDeconv) and its inverse transform is used as a spatial restoration
+    kernel for blockConvolve, so kernelSize should be a few times larger
+    than H. The regulariser of imageDeconv has a kink at the zero
+    frequencies, which gives its restoration kernel long tails that the
+    kernel can't hold, so inside the borders the result differs from
+    imageDeconv by about 1% of the range for k = 1e-6, and by a few percent
+    for larger k, much less than either differs from the original image.
+    :return: the restored image (out)
+    """
+    W = ex4.WienerDeconvolver(H).filter((kernelSize, kernelSize), k, G.shape)
+    restore = np.fft.irfft2(W, (kernelSize, kernelSize))
+    # imageDeconv rolls by half the kernel, and blockConvolve expects the
+    # center of the kernel in its middle
+    shift = int(np.shape(H)[0] / 2.0) + (kernelSize - 1) // 2
+    restore = np.roll(restore, (shift, shift), (0, 1))
+    return blockConvolve(G, restore, out, blockSize, numOfThreads)
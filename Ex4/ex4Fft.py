@@ -0,0 +1,247 @@
+# IMPR 2017, IDC
+# ex4 fft - fast fourier transform used by Fourier1D / invFourier1D
+
+from collections import OrderedDict
+
+import numpy as np
+
+# sizes up to this are transformed by a single product with the DFT matrix
+MAX_MATRIX_SIZE = 64
+# mixed radix steps with up to this many sub-transforms combine them with one
+# matrix product, larger ones use a plan
+MAX_COMBINE_SIZE = 512
+# plans are kept in an LRU cache that holds at most this many bytes of tables,
+# with the tables of the plans they use
+PLAN_CACHE_BYTES = 64 * 2 ** 20
+
+planCache = OrderedDict()
+
+
+def fft(x, inverse=False, dtype=None):
+    """
+    O(n log n) discrete fourier transform, gives the same results as np.fft.fft
+    (or np.fft.ifft when inverse is True).
+    :param x: 1D signal, or 2D array where every row is a separate signal
+    :param inverse: compute the inverse transform (including the 1/n scaling)
+    :param dtype: complex64 or complex128, by default complex64 only for
+    float32/complex64 inputs
+    :return: complex array the shape of x
+    """
+    x = np.asarray(x)
+    if dtype is None:
+        dtype = np.result_type(x.dtype, np.complex64)
+    n = x.shape[-1]
+    rows = np.array(x, dtype=dtype).reshape(-1, n)
+    res = getPlan(n, 1 if inverse else -1, dtype).apply(rows)
+    if inverse:
+        res /= n
+    return res.reshape(x.shape)
+
+
+def getPlan(n, sign, dtype=complex):
+    """
+    get the plan for transforms of length n from the cache, or create it.
+    :param sign: -1 for the forward and +1 for the inverse transform
+    """
+    key = (n, sign, np.dtype(dtype))
+    plan = planCache.get(key)
+    if plan is not None:
+        planCache.move_to_end(key)
+        return plan
+    plan = FftPlan(n, sign, dtype)
+    planCache[key] = plan
+    # drop the least recently used plans until the tables fit the budget.
+    # the sub-plans of a plan stay with it also when they are dropped
+    while planBytes(planCache.values()) > PLAN_CACHE_BYTES and len(planCache) > 1:
+        planCache.popitem(last=False)
+    return plan
+
+
+def planBytes(plans):
+    # bytes of the tables of the plans and of all their sub-plans, every
+    # plan counted once
+    seen, total = set(), 0
+    stack = list(plans)
+    while stack:
+        plan = stack.pop()
+        if id(plan) not in seen:
+            seen.add(id(plan))
+            total += sum(a.nbytes for a in plan.arrays)
+            stack.extend(plan.subPlans())
+    return total
+
+
+def clearPlanCache():
+    planCache.clear()
+
+
+class FftPlan:
+    """
+    precomputed tables for transforms of one (length, direction, dtype).
+    apply() transforms a (batch, n) array with one matrix product for small n,
+    or with one set of butterflies per stage for larger n.
+    """
+
+    def __init__(self, n, sign, dtype=complex):
+        self.n = n
+        self.sign = sign
+        self.dtype = np.dtype(dtype)
+        self.arrays = []
+        if n <= MAX_MATRIX_SIZE:
+            self.kind = 'matrix'
+            self.matrix = self.table(dftMatrix(n, sign).T)
+        elif n & (n - 1) == 0:
+            self.kind = 'radix2'
+            self.permutation = self.table(bitReverse(n))
+            # twiddles of the stage that merges blocks of size 2 * half
+            self.twiddles = []
+            half = 1
+            while half < n:
+                self.twiddles.append(self.table(
+                    np.exp(sign * 1j * np.pi * np.arange(half) / half)))
+                half *= 2
+        else:
+            p = smallestFactor(n)
+            if p == n:
+                self.initBluestein()
+            else:
+                # n = p * m: transform the p decimated sub-signals x[r::p] of
+                # length m, multiply by the twiddles and combine them with
+                # p-point DFTs, by one matrix product for small p and by a
+                # plan of their own for large p (n = p * m with two large
+                # primes would otherwise cost O(n * p))
+                self.kind = 'mixed'
+                self.p = p
+                self.m = n // p
+                self.subPlan = getPlan(self.m, sign, dtype)
+                r, k = np.meshgrid(np.arange(p), np.arange(self.m),
+                                   indexing='ij')
+                self.twiddles = self.table(np.exp(sign * 2j * np.pi * r * k / n))
+                if p <= MAX_COMBINE_SIZE:
+                    self.matrix = self.table(dftMatrix(p, sign))
+                    self.combinePlan = None
+                else:
+                    self.combinePlan = getPlan(p, sign, dtype)
+
+    def initBluestein(self):
+        # write the DFT as a convolution with a chirp, and do the convolution
+        # with power of two transforms
+        n = self.n
+        self.kind = 'bluestein'
+        self.size = 1 << (2 * n - 2).bit_length()
+        j = np.arange(n)
+        # j^2 mod 2n keeps the angles small and accurate for large n
+        self.chirp = self.table(
+            np.exp(self.sign * 1j * np.pi * ((j * j) % (2 * n)) / n))
+        b = np.zeros((1, self.size), dtype=self.dtype)
+        b[0, :n] = np.conjugate(self.chirp)
+        b[0, self.size - n + 1:] = np.conjugate(self.chirp[1:])[::-1]
+        self.forward = getPlan(self.size, -1, self.dtype)
+        self.backward = getPlan(self.size, 1, self.dtype)
+        # the chirp spectrum, with the 1/size of the inverse already in it
+        self.kernelSpectrum = self.table(self.forward.apply(b) / self.size)
+
+    def table(self, values):
+        values = np.asarray(values)
+        if values.dtype.kind == 'c':
+            values = values.astype(self.dtype)
+        self.arrays.append(values)
+        return values
+
+    def subPlans(self):
+        return [plan for plan in (getattr(self, 'subPlan', None),
+                                  getattr(self, 'combinePlan', None),
+                                  getattr(self, 'forward', None),
+                                  getattr(self, 'backward', None))
+                if plan is not None]
+
+    @property
+    def nbytes(self):
+        # with the tables of the sub-plans
+        return planBytes([self])
+
+    def apply(self, x):
+        """
+        :param x: (batch, n) array
+        :return: the transform of every row (without the 1/n of the inverse)
+        """
+        if self.kind == 'matrix':
+            return x.dot(self.matrix)
+        if self.kind == 'radix2':
+            return self.applyRadix2(x)
+        if self.kind == 'mixed':
+            return self.applyMixed(x)
+        return self.applyBluestein(x)
+
+    def applyRadix2(self, x):
+        # iterative decimation in time, each stage does all its butterflies
+        # at once
+        batch, n = x.shape
+        res = x[:, self.permutation]
+        half = 1
+        for twiddles in self.twiddles:
+            res = res.reshape(batch, n // (2 * half), 2, half)
+            even = res[:, :, 0, :]
+            odd = res[:, :, 1, :] * twiddles
+            res = np.stack((even + odd, even - odd), axis=2)
+            half *= 2
+        return res.reshape(batch, n)
+
+    def applyMixed(self, x):
+        batch, n = x.shape
+        p, m = self.p, self.m
+        sub = x.reshape(batch, m, p).transpose(0, 2, 1).reshape(batch * p, m)
+        sub = self.subPlan.apply(sub).reshape(batch, p, m)
+        sub *= self.twiddles
+        # X[k + m * q] = sum over r of W_p^(r * q) * sub[r, k]
+        if self.combinePlan is None:
+            res = np.einsum('qr,brk->bqk', self.matrix, sub)
+        else:
+            res = self.combinePlan.apply(sub.transpose(0, 2, 1).reshape(batch * m, p))
+            res = res.reshape(batch, m, p).transpose(0, 2, 1)
+        return res.reshape(batch, n)
+
+    def applyBluestein(self, x):
+        batch, n = x.shape
+        a = np.zeros((batch, self.size), dtype=self.dtype)
+        a[:, :n] = x * self.chirp
+        conv = self.backward.apply(self.forward.apply(a) * self.kernelSpectrum)
+        return conv[:, :n] * self.chirp
+
+
+def nextFastLen(n):
+    # smallest 2^a * 3^b * 5^c that is >= n, such sizes transform fast
+    best = 1 << (n - 1).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            size = p35
+            while size < n:
+                size *= 2
+            best = min(best, size)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def smallestFactor(n):
+    for p in range(2, int(np.sqrt(n)) + 1):
+        if n % p == 0:
+            return p
+    return n
+
+
+def bitReverse(n):
+    # permutation that puts every index at its bit reversed place
+    bits = n.bit_length() - 1
+    indices = np.arange(n)
+    rev = np.zeros(n, dtype=int)
+    for b in range(bits):
+        rev |= ((indices >> b) & 1) << (bits - 1 - b)
+    return rev
+
+
+def dftMatrix(n, sign):
+    k = np.arange(n)
+    return np.exp(sign * 2j * np.pi * np.outer(k, k) / n)
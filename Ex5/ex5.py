@@ -1,16 +1,243 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-from scipy.signal import convolve2d
 
 
 # Task 1: Gaussian pyramid
-def gaussianPyramid(img, numOfLevels, filterParam):
-    G = {0: img}
-    for i in range(1, numOfLevels):
-        # every entry of dict is the previous after reduce function
-        G[i] = reduce(G[i - 1], filterParam)
+def gaussianPyramid(img, numOfLevels, filterParam, out=None, numOfThreads=1):
+    """
+    :param img: image (rows, cols), color image (rows, cols, channels), or a
+    batch of color images (frames, rows, cols, channels)
+    :param out: Pyramid of the shape of img to build into, a new one by default
+    :param numOfThreads: number of threads the frames of a batch are split to
+    :return: the Gaussian pyramid (a Pyramid, indexed like a dict of levels)
+    """
+    G = out if out is not None else Pyramid(np.shape(img), numOfLevels)
+    G[0] = img
+
+    def build(frames):
+        for i in range(1, numOfLevels):
+            # every level is the previous after reduce function, all the
+            # channels and frames at once
+            reduce(G.planes[i - 1][frames], filterParam, out=G.planes[i][frames])
+
+    forFrames(build, G.planes[0], numOfThreads)
     return G
 
 
+def forFrames(func, planes, numOfThreads):
+    # call func with slices of the frames of a batch (planes of 4 dimensions)
+    # in a thread pool, or once with all of planes
+    if numOfThreads <= 1 or planes.ndim < 4:
+        func(slice(None))
+        return
+    chunks = np.array_split(np.arange(planes.shape[0]), numOfThreads)
+    with ThreadPoolExecutor(numOfThreads) as executor:
+        list(executor.map(func, [slice(c[0], c[-1] + 1) for c in chunks if len(c)]))
+
+
+def toPlanes(img):
+    # view of a color image (rows, cols, channels) as (channels, rows, cols),
+    # and of a batch (frames, rows, cols, channels) as (frames, channels,
+    # rows, cols), so rows and columns are the last two axes
+    return np.moveaxis(img, -1, -3) if np.ndim(img) > 2 else img
+
+
+def fromPlanes(planes):
+    # the inverse of toPlanes
+    return np.moveaxis(planes, -3, -1) if np.ndim(planes) > 2 else planes
+
+
+class Pyramid:
+    """
+    All the levels of a pyramid in one contiguous 1D buffer. The buffer starts
+    with a header [numOfLevels, ndim, shape of level 0], so the
+    buffer alone describes the pyramid: it can be saved with np.save, loaded
+    back (also memory mapped) with Pyramid.load, or put in shared memory.
+    Every level is a view of the buffer, indexed like the dicts of levels,
+    p[0] is the finest level and every next level has half the rows and
+    columns (rounded up, like reduce).
+    Levels of color images and batches are stored as planes (see toPlanes),
+    in planes[i], and seen in the shape of the image.
+    """
+
+    def __init__(self, shape, numOfLevels, buffer=None, dtype=float):
+        """
+        :param shape: shape of level 0
+        :param numOfLevels: number of levels
+        :param buffer: 1D buffer of Pyramid.bufferSize(shape, numOfLevels)
+        elements to use (e.g. np.memmap), a new one by default
+        :param dtype: dtype of a new buffer
+        """
+        shape = tuple(shape)
+        self.shapes = levelShapes(shape, numOfLevels)
+        headerSize = 2 + len(shape)
+        sizes = [int(np.prod(levelShape)) for levelShape in self.shapes]
+        self.offsets = headerSize + np.concatenate(([0], np.cumsum(sizes))).astype(int)
+        if buffer is None:
+            buffer = np.empty(self.offsets[-1], dtype)
+        if buffer.shape != (self.offsets[-1],):
+            raise ValueError('buffer must have %d elements' % self.offsets[-1])
+        if buffer.flags.writeable:
+            buffer[:headerSize] = (numOfLevels, len(shape)) + shape
+        self.buffer = buffer
+        # all the levels, without the header
+        self.data = buffer[headerSize:]
+        self.planes = [buffer[self.offsets[i]:self.offsets[i + 1]].reshape(planesShape(self.shapes[i]))
+                       for i in range(numOfLevels)]
+        self.levels = [fromPlanes(planes) for planes in self.planes]
+
+    @staticmethod
+    def bufferSize(shape, numOfLevels):
+        return 2 + len(shape) + sum(int(np.prod(levelShape))
+                                    for levelShape in levelShapes(shape, numOfLevels))
+
+    @staticmethod
+    def fromBuffer(buffer):
+        # the pyramid stored in a buffer of another Pyramid
+        numOfLevels, ndim = int(buffer[0]), int(buffer[1])
+        shape = tuple(int(v) for v in buffer[2:2 + ndim])
+        return Pyramid(shape, numOfLevels, buffer)
+
+    @staticmethod
+    def load(file, mmapMode=None):
+        """
+        :param file: file written by Pyramid.save
+        :param mmapMode: mmap_mode of np.load, e.g. 'r' to map the file
+        instead of reading it
+        """
+        return Pyramid.fromBuffer(np.load(file, mmap_mode=mmapMode))
+
+    def save(self, file):
+        np.save(file, self.buffer)
+
+    @property
+    def shape(self):
+        return self.shapes[0]
+
+    @property
+    def numOfLevels(self):
+        return len(self.levels)
+
+    def __getitem__(self, level):
+        return self.levels[level]
+
+    def __setitem__(self, level, value):
+        self.levels[level][...] = value
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __iter__(self):
+        return iter(range(len(self.levels)))
+
+    def keys(self):
+        return range(len(self.levels))
+
+    def values(self):
+        return list(self.levels)
+
+    def items(self):
+        return list(enumerate(self.levels))
+
+
+class LazyPyramid:
+    """
+    Gaussian pyramid whose levels are computed only when they are indexed.
+    A level is reduced from the nearest finer level already in memory, and
+    every level on the way is kept, so later requests continue from there.
+    With a memory limit the finest computed levels are dropped first (the
+    coarse ones are small and expensive to reach), and a dropped level is
+    computed again from the nearest finer level still kept, or from img.
+    """
+
+    def __init__(self, img, numOfLevels, filterParam, memoryLimit=None):
+        """
+        :param img: the image of level 0, it is not copied
+        :param numOfLevels: number of levels
+        :param filterParam: parameter of the kernel
+        :param memoryLimit: bytes of computed levels to keep (img itself is
+        not counted), no limit by default
+        """
+        self.img = img
+        self.numOfLevels = numOfLevels
+        self.filterParam = filterParam
+        self.memoryLimit = memoryLimit
+        self.shapes = levelShapes(np.shape(img), numOfLevels)
+        self.levels = {0: img}
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for i, level in self.levels.items() if i > 0)
+
+    def cached(self):
+        # the levels in memory
+        return sorted(self.levels)
+
+    def __getitem__(self, level):
+        if level < 0:
+            level += self.numOfLevels
+        if not 0 <= level < self.numOfLevels:
+            raise IndexError('level out of range')
+        if level not in self.levels:
+            # continue the reduce chain from the nearest finer level in memory
+            i = max(i for i in self.levels if i < level)
+            while i < level:
+                self.levels[i + 1] = fromPlanes(reduce(toPlanes(self.levels[i]), self.filterParam))
+                i += 1
+                self.dropFine(i)
+        return self.levels[level]
+
+    def dropFine(self, keep):
+        # drop the finest levels (finer than keep) until the limit is met
+        if self.memoryLimit is None:
+            return
+        for i in sorted(self.levels):
+            if self.nbytes <= self.memoryLimit:
+                break
+            if 0 < i < keep:
+                del self.levels[i]
+
+    def drop(self, level):
+        if level > 0:
+            self.levels.pop(level, None)
+
+    def __len__(self):
+        return self.numOfLevels
+
+    def __iter__(self):
+        return iter(range(self.numOfLevels))
+
+    def keys(self):
+        return range(self.numOfLevels)
+
+    def values(self):
+        return [self[i] for i in range(self.numOfLevels)]
+
+    def items(self):
+        return [(i, self[i]) for i in range(self.numOfLevels)]
+
+
+def levelShapes(shape, numOfLevels):
+    # shapes of the levels of a pyramid, as computed by reduce, where the rows
+    # and columns are the last two axes of an image and the two before the
+    # channels of color images and batches
+    shape = list(shape)
+    axes = (-2, -1) if len(shape) == 2 else (-3, -2)
+    shapes = []
+    for i in range(numOfLevels):
+        shapes.append(tuple(shape))
+        for axis in axes:
+            shape[axis] = (shape[axis] + 1) // 2
+    return shapes
+
+
+def planesShape(shape):
+    # the shape of toPlanes of an array of the given shape
+    shape = tuple(shape)
+    return shape if len(shape) == 2 else shape[:-3] + (shape[-1],) + shape[-3:-1]
+
+
 def getKernel(filterParam):
     # using gaussian weights
     return np.array([0.25 - filterParam / 2.0, 0.25, filterParam, 0.25, 0.25 - filterParam / 2.0])
@@ -21,99 +248,471 @@ def getKernel2d(filterParam):
     return np.outer(vector, vector)
 
 
-def reduce(image, filterParam):
+def reduce(image, filterParam, out=None):
+    # image is (..., rows, cols), the images of a stack are reduced together
+    rows, cols = image.shape[-2:]
+    if out is None:
+        out = np.zeros(image.shape[:-2] + ((rows + 1) // 2, (cols + 1) // 2))
+    return forStack(lambda part, partOut: reduceStack(part, filterParam, partOut), image, out)
+
+
+def reduceStack(image, filterParam, newImage):
     kernel = getKernel(filterParam)
-    # taking only every second pixel of the image after convolution
-    newImage = imConv2(image, kernel)
-    newImage = np.array(newImage[::2, ::2])
+    padding = int(kernel.shape[0] / 2.0)
+    rows, cols = image.shape[-2:]
+    stack = image.shape[:-2]
+    imgPad = np.pad(image, [(0, 0)] * len(stack) + [(padding, padding)] * 2, 'constant')
+    # only every second pixel of the convolution is kept, so the rows are
+    # filtered only at the even columns, and then the columns only at the
+    # even rows (same sums, in the same order, as imConv2)
+    tempRes = np.zeros(stack + (imgPad.shape[-2], (cols + 1) // 2))
+    for i in np.arange(0, kernel.shape[0]):
+        tempRes += imgPad[..., i:i + cols:2] * kernel[i]
+
+    newImage[...] = 0
+    for i in np.arange(0, kernel.shape[0]):
+        newImage += tempRes[..., i:i + rows:2, :] * kernel[i]
     return newImage
 
 
+# stacks of images are filtered in parts of about this many bytes, so the
+# temporaries of every tap stay in the cache
+STACK_BYTES = 2 ** 22
+
+
+def forStack(func, image, out):
+    # func(part of image, part of out) on parts of a stack (..., rows, cols),
+    # split along the first axes until they are small enough
+    if image.ndim == 2 or image.size * 8 <= STACK_BYTES:
+        func(image, out)
+    else:
+        for j in range(image.shape[0]):
+            forStack(func, image[j], out[j])
+    return out
+
+
 # bonus
-def imConv2(img, kernel1D):
-    padding = int(kernel1D.shape[0] / 2.0)
-    # adding padding to avoid overflow
-    imgPad = np.pad(img, padding, 'constant')
+BORDERS = ('zero', 'replicate', 'reflect')
 
-    tempResX = np.zeros(imgPad.shape)
-    tempResY = np.zeros(imgPad.shape)
 
-    # separate convolution to rows and columns
-    for i in np.arange(0, kernel1D.shape[0]):
-        window = imgPad[:, i:imgPad.shape[0] - 2 * padding + i]
-        tempResY[:, padding:-padding] = tempResY[:, padding:-padding] + window * kernel1D[i]
+def imConv2(img, kernel1D, border='zero', out=None, bandRows=None):
+    """
+    separable convolution of the image with kernel1D along the rows and then
+    along the columns, the result has the shape of img.
+    the image is filtered in bands of rows, every band is padded, filtered
+    along the rows and then along the columns in the same small buffers, so
+    the data stays in the cache and nothing of the size of the image is
+    allocated.
+    :param img: image, or a stack of images (..., rows, cols)
+    :param kernel1D: 1D kernel of any length
+    :param border: the values outside the image - 'zero', 'replicate' (the
+    edge pixel) or 'reflect' (mirrored about the edge pixel)
+    :param out: preallocated float32 or float64 array the shape of img to
+    write into, by default float32 for a float32 img and float64 otherwise
+    :param bandRows: number of rows filtered at a time
+    :return: the convolved image (out)
+    """
+    if border not in BORDERS:
+        raise ValueError('border must be one of ' + ', '.join(BORDERS))
+    img = np.asarray(img)
+    if out is None:
+        out = np.empty(img.shape, np.float32 if img.dtype == np.float32 else float)
+    kernel1D = np.asarray(kernel1D, dtype=out.dtype)
+    size = kernel1D.shape[0]
+    padding = int(size / 2.0)
+    rows, cols = img.shape[-2:]
+    if bandRows is None:
+        # about 256KB of float64 per band buffer
+        bandRows = max(8, 2 ** 15 // max(cols, 1))
+    bandRows = max(1, min(bandRows, rows))
 
-    for i in np.arange(0, kernel1D.shape[0]):
-        window = tempResY[i:imgPad.shape[1] - 2 * padding + i, :]
-        tempResX[padding:-padding, :] = tempResX[padding:-padding, :] + window * kernel1D[i]
+    # scratch buffers of one band, reused by all the bands and all the taps
+    bandPad = np.empty((bandRows + size - 1, cols + size - 1), out.dtype)
+    tempRes = np.empty((bandRows + size - 1, cols), out.dtype)
+    tap = np.empty((bandRows + size - 1, cols), out.dtype)
+    colIdx = borderIndex(np.arange(-padding, cols + size - 1 - padding), cols, border)
+
+    for index in np.ndindex(img.shape[:-2]):
+        image, res = img[index], out[index]
+        for r0 in range(0, rows, bandRows):
+            n = min(bandRows, rows - r0)
+            m = n + size - 1
+            rowIdx = borderIndex(np.arange(r0 - padding, r0 - padding + m), rows, border)
+            padBand(image, r0 - padding, rowIdx, colIdx, padding, bandPad[:m])
+            # separate convolution to rows and columns
+            convolveTaps(bandPad[:m], kernel1D, tempRes[:m], tap[:m], axis=1)
+            convolveTaps(tempRes[:m], kernel1D, res[r0:r0 + n], tap[:n], axis=0)
+    return out
 
-    # ignoring zero padding
-    return tempResX[padding:img.shape[0] + padding, padding:img.shape[1] + padding]
+
+def borderIndex(indices, size, border):
+    # the pixel used for every index along an axis of the given size, -1 for
+    # the zeros outside the image
+    if border == 'zero':
+        return np.where((indices >= 0) & (indices < size), indices, -1)
+    if border == 'replicate' or size == 1:
+        return np.clip(indices, 0, size - 1)
+    period = 2 * (size - 1)
+    indices = np.abs(indices) % period
+    return np.where(indices < size, indices, period - indices)
+
+
+def padBand(image, start, rowIdx, colIdx, padding, bandPad):
+    # bandPad[y, x] = image[rowIdx[y], colIdx[x]], or zero for index -1, where
+    # the band starts at row start of the image
+    rows, cols = image.shape
+    # the rows inside the image are one block, copied at once
+    y0, y1 = max(0, -start), min(len(rowIdx), rows - start)
+    bandPad[y0:y1, padding:padding + cols] = image[start + y0:start + y1]
+    for y in list(range(0, y0)) + list(range(y1, len(rowIdx))):
+        if rowIdx[y] < 0:
+            bandPad[y, padding:padding + cols] = 0
+        else:
+            bandPad[y, padding:padding + cols] = image[rowIdx[y]]
+    # the columns outside the image are copied from the padded rows
+    for x in list(range(0, padding)) + list(range(padding + cols, len(colIdx))):
+        if colIdx[x] < 0:
+            bandPad[:, x] = 0
+        else:
+            bandPad[:, x] = bandPad[:, padding + colIdx[x]]
+
+
+def convolveTaps(x, kernel1D, out, tap, axis):
+    # out = sum of kernel1D[i] * x shifted by i along the axis, every product
+    # is written into the same tap buffer
+    length = out.shape[axis]
+    for i in np.arange(0, kernel1D.shape[0]):
+        window = x[i:i + length] if axis == 0 else x[:, i:i + length]
+        if i == 0:
+            np.multiply(window, kernel1D[0], out=out)
+        else:
+            np.multiply(window, kernel1D[i], out=tap)
+            out += tap
+    return out
 
 
 # Task 2: Laplacian pyramid
 # a
-def laplacianPyramid(img, numOfLevels, filterParam):
-    L = {}
-    G = gaussianPyramid(img, numOfLevels, filterParam)
-    for i in range(0, numOfLevels - 1):
-        Gi = G[i]
-        expandedG = expand(G[i + 1], filterParam)
-        # fixes the size of the unexpanded level if needed
-        # by duplicating the last row/col
-        if expandedG.shape[0] > Gi.shape[0]:
-            newRow = np.array(Gi[Gi.shape[0] - 1])
-            Gi = np.concatenate(Gi, newRow)
-        if expandedG.shape[1] > Gi.shape[1]:
-            newCol = np.array(Gi[:, 0])
-            Gi = np.concatenate(Gi, newCol)
-        L[i] = Gi - expandedG
-    L[numOfLevels - 1] = G[numOfLevels - 1]
+def laplacianPyramid(img, numOfLevels, filterParam, out=None, numOfThreads=1):
+    """
+    :param img: image, color image or batch, like gaussianPyramid
+    :param out: Pyramid of the shape of img to build into, a new one by default
+    :param numOfThreads: number of threads the frames of a batch are split to
+    :return: the Laplacian pyramid (a Pyramid, indexed like a dict of levels)
+    """
+    L = gaussianPyramid(img, numOfLevels, filterParam, out, numOfThreads)
+
+    def build(frames):
+        # the Gaussian levels become Laplacian levels in place, from the
+        # finest one, so the coarser level is still Gaussian when it is
+        # expanded. it is expanded straight to the size of the finer level,
+        # which is smaller than twice the coarser one when its size is odd
+        scratch = np.empty(L.planes[0][frames].size)
+        for i in range(0, numOfLevels - 1):
+            finer = L.planes[i][frames]
+            finer -= expand(L.planes[i + 1][frames], filterParam, finer.shape,
+                            out=scratchView(scratch, finer.shape))
+
+    forFrames(build, L.planes[0], numOfThreads)
     return L
 
 
-def expand(image, filterParam):
+def scratchView(scratch, shape):
+    # the start of a 1D scratch buffer as an array of the given shape
+    return scratch[:int(np.prod(shape))].reshape(shape)
+
+
+def expand(image, filterParam, shape=None, out=None):
+    """
+    twice larger image, as if zeros were inserted between the pixels of image
+    and the result was convolved with the kernel (and multiplied by 4).
+    every even and every odd output pixel is computed directly from the
+    pixels of image with the taps of the kernel that fall on them (3 and 2
+    taps for the 5 taps kernel), so no zeros are multiplied.
+    :param image: the image to expand, or a stack of images (..., rows, cols)
+    :param filterParam: parameter of the kernel
+    :param shape: rows and columns of the expanded image (the last two of the
+    shape given), at most twice those of image (the default)
+    :param out: preallocated float array to write into
+    :return: the expanded image
+    """
+    if shape is None:
+        shape = (image.shape[-2] * 2, image.shape[-1] * 2)
+    if out is None:
+        out = np.empty(image.shape[:-2] + tuple(shape[-2:]))
+    return forStack(lambda part, partOut: expandStack(part, filterParam, partOut), image, out)
+
+
+def expandStack(image, filterParam, out):
     kernel = getKernel(filterParam)
-    # creates an image twice the size,
-    # only fills every other pixel with values of given image
-    # the rest are zeros
-    newImage = np.zeros((image.shape[0] * 2, image.shape[1] * 2))
-    newImage[::2, ::2] = image[:, :]
-    # multiply by 4 to normalize after kernel (divides by 4)
-    newImage = 4 * imConv2(newImage, kernel)
-    return np.array(newImage, dtype=int)
+    # columns first, then the rows
+    tempRes = np.empty(image.shape[:-1] + out.shape[-1:])
+    expandAxis(np.asarray(image, dtype=float), kernel, tempRes, -1)
+    expandAxis(tempRes, kernel, out, -2)
+    return out
+
+
+def expandAxis(x, kernel, out, axis):
+    # out[y] = 2 * sum of kernel[i] * up[y + i - padding] along the axis, where
+    # up has the values of x at the even places and zeros at the odd ones
+    padding = int(kernel.shape[0] / 2.0)
+    margin = padding // 2 + 1
+    padWidth = [(0, 0)] * x.ndim
+    padWidth[axis] = (margin, margin)
+    xPad = np.pad(x, padWidth, 'constant')
+
+    def along(a, indices):
+        index = [slice(None)] * a.ndim
+        index[axis] = indices
+        return a[tuple(index)]
+
+    for phase in (0, 1):
+        phaseOut = along(out, slice(phase, None, 2))
+        phaseOut[...] = 0
+        count = phaseOut.shape[axis]
+        for i in np.arange(0, kernel.shape[0]):
+            if (phase + i - padding) % 2 != 0:
+                continue
+            offset = margin + (phase + i - padding) // 2
+            phaseOut += 2 * kernel[i] * along(xPad, slice(offset, offset + count))
+    return out
+
+
+class QuantizedPyramid:
+    """
+    Compact storage of a Laplacian pyramid. Every level is quantized to int8
+    (or int16) with a scale of its own, the coarsest level, which is not a
+    difference image, always to int16. Most coefficients of the detail levels
+    are close to 0 and quantize to 0, so with sparse=True a level is stored
+    as a bitmap of its nonzero coefficients and their values, when that is
+    smaller. Indexing gives the dequantized float level, so the pyramid can
+    be given to imgFromLaplacianPyramid as is.
+    """
+
+    def __init__(self, laplacePrmd, numOfLevels, bits=8, step=None, sparse=False):
+        """
+        :param laplacePrmd: Pyramid, or dict of levels
+        :param bits: 8 or 16, bits of the detail levels
+        :param step: quantization step of the detail levels (the error of a
+        coefficient is at most step / 2), by default the smallest step for
+        which the largest coefficient of the level fits in the bits. a larger
+        step zeroes more coefficients
+        :param sparse: store mostly zero levels as a bitmap and the nonzero values
+        """
+        self.levels = []
+        for i in range(numOfLevels):
+            level = np.asarray(laplacePrmd[i], dtype=float)
+            dtype = np.int16 if bits > 8 or i == numOfLevels - 1 else np.int8
+            qmax = np.iinfo(dtype).max
+            maxAbs = np.abs(level).max() if level.size else 0
+            scale = max(maxAbs / qmax, step if step is not None and i < numOfLevels - 1 else 0)
+            if scale == 0:
+                scale = 1.0
+            q = np.rint(level / scale).astype(dtype)
+            self.levels.append(encodeLevel(q, scale, sparse))
+
+    @property
+    def nbytes(self):
+        return sum(sum(a.nbytes for a in arrays) for _, _, _, arrays in self.levels)
+
+    def __getitem__(self, level):
+        return decodeLevel(*self.levels[level])
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __iter__(self):
+        return iter(range(len(self.levels)))
+
+    def keys(self):
+        return range(len(self.levels))
+
+    def items(self):
+        return [(i, self[i]) for i in range(len(self.levels))]
+
+
+def encodeLevel(q, scale, sparse):
+    # (shape, scale, kind, arrays) of a quantized level
+    if sparse:
+        nonzero = q != 0
+        bitmap = np.packbits(nonzero.ravel())
+        values = q[nonzero]
+        if bitmap.nbytes + values.nbytes < q.nbytes:
+            return q.shape, scale, 'sparse', (bitmap, values)
+    return q.shape, scale, 'dense', (q,)
+
+
+def decodeLevel(shape, scale, kind, arrays):
+    if kind == 'dense':
+        return arrays[0] * scale
+    bitmap, values = arrays
+    level = np.zeros(shape)
+    nonzero = np.unpackbits(bitmap, count=int(np.prod(shape))).view(bool).reshape(shape)
+    level[nonzero] = values * scale
+    return level
 
 
 # b
-def imgFromLaplacianPyramid(laplacePrmd, numOfLevels, filterParam):
-    # creates the size of the final image to be returned
-    image = np.zeros(laplacePrmd[0].shape)
-    for i in range(numOfLevels - 1, 0, -1):
-        eLi = expand(laplacePrmd[i], filterParam)
-        Li1 = laplacePrmd[i - 1]
-        # fixes the expanded to be as the size of the previous
-        # level of the pyramid for future valid summary
-        if eLi.shape[0] > Li1.shape[0]:
-            eLi = np.delete(eLi, 0, axis=0)
-        if eLi.shape[1] > Li1.shape[1]:
-            eLi = np.delete(eLi, 0, axis=1)
-        reconstructedLevel = Li1 + eLi
-        laplacePrmd[i - 1] = reconstructedLevel
-        image = reconstructedLevel
-    return image
+def imgFromLaplacianPyramid(laplacePrmd, numOfLevels, filterParam, out=None,
+                            numOfThreads=1):
+    """
+    collapse the Laplacian pyramid, the pyramid itself is not changed.
+    :param laplacePrmd: Pyramid, or dict of levels
+    :param out: preallocated float array of the shape of level 0
+    :param numOfThreads: number of threads the frames of a batch are split to
+    :return: the reconstructed image (out)
+    """
+    planes = [toPlanes(np.asarray(laplacePrmd[i])) for i in range(numOfLevels)]
+    if out is None:
+        out = np.empty(fromPlanes(planes[0]).shape)
+    outPlanes = toPlanes(out)
+
+    def collapse(frames):
+        # every level is expanded from one scratch buffer into the other, and
+        # the last one into out, so the scratch only holds level 1 or coarser
+        size = planes[1][frames].size if numOfLevels > 2 else 0
+        scratch = [np.empty(size) for _ in range(2)]
+        image = planes[numOfLevels - 1][frames]
+        for i in range(numOfLevels - 1, 0, -1):
+            finer = planes[i - 1][frames]
+            if i == 1:
+                target = outPlanes[frames]
+            else:
+                target = scratchView(scratch[i % 2], finer.shape)
+            # expands to the size of the previous level of the pyramid
+            expand(image, filterParam, finer.shape, out=target)
+            target += finer
+            image = target
+        if numOfLevels == 1:
+            outPlanes[frames] = image
+
+    forFrames(collapse, outPlanes, numOfThreads)
+    return out
 
 
 # Task 3: Image blending
-def imgBlending(img1, img2, blendingMask, numOfLevels, filterParam):
+def imgBlending(img1, img2, blendingMask, numOfLevels, filterParam, numOfThreads=1):
+    # images can be color images or batches, and a mask of rows and columns
+    # only weights all the channels
+    blendingMask = broadcastMask(blendingMask, np.shape(img1))
     # Build Laplacian pyramids LA and LB from images A and B
-    LA = laplacianPyramid(img1, numOfLevels, filterParam)
-    LB = laplacianPyramid(img2, numOfLevels, filterParam)
+    LA = laplacianPyramid(img1, numOfLevels, filterParam, numOfThreads=numOfThreads)
+    LB = laplacianPyramid(img2, numOfLevels, filterParam, numOfThreads=numOfThreads)
     # Build a Gaussian pyramid GM from selected mask
-    GM = gaussianPyramid(blendingMask, numOfLevels, filterParam)
-    # Form a combined pyramid LS from LA and LB using nodes of GM as weights
-    LS = {}
-    for key in LA.keys():
-        LS[key] = GM[key] * LA[key] + (1 - GM[key]) * LB[key]
+    GM = gaussianPyramid(blendingMask, numOfLevels, filterParam, numOfThreads=numOfThreads)
+    # Form a combined pyramid LS = GM * LA + (1 - GM) * LB = LB + GM * (LA - LB)
+    # from LA and LB using nodes of GM as weights, all the levels at once in
+    # the buffer of LA
+    LS = LA
+    LS.data -= LB.data
+    LS.data *= GM.data
+    LS.data += LB.data
     # Collapse the LS pyramid to get the final blended image
-    blendImg = imgFromLaplacianPyramid(LS, numOfLevels, filterParam)
+    blendImg = imgFromLaplacianPyramid(LS, numOfLevels, filterParam, numOfThreads=numOfThreads)
     return blendImg
+
+
+def broadcastMask(mask, shape):
+    # the mask in the shape of the images, a mask of rows and columns is the
+    # same for all the channels (and frames)
+    mask = np.asarray(mask)
+    if mask.ndim == 2 and len(shape) > 2:
+        mask = mask[..., np.newaxis]
+    return np.broadcast_to(mask, shape)
+
+
+def multiBlending(images, masks, numOfLevels, filterParam):
+    """
+    blend any number of images in one pass: every image's Laplacian pyramid
+    and every mask's Gaussian pyramid are built once (into the same two
+    buffers), weighted and summed into one pyramid, which is normalized by the
+    sum of the weights at every level and collapsed once.
+    images and masks can be generators, only one image is in memory at a time.
+    for two images with masks m and 1 - m it is like imgBlending, except near
+    the borders, where the weights of the Gaussian pyramids are normalized
+    instead of summing to less than 1.
+    :param images: sequence of images of the same shape
+    :param masks: weight masks of the images, of the same shape
+    :return: the blended image
+    """
+    LS = LI = GW = den = None
+    for img, mask in zip(images, masks):
+        if LS is None:
+            LS = Pyramid(np.shape(img), numOfLevels)
+            den = Pyramid(np.shape(img), numOfLevels)
+            LI = Pyramid(np.shape(img), numOfLevels)
+            GW = Pyramid(np.shape(img), numOfLevels)
+            LS.data[...] = 0
+            den.data[...] = 0
+        laplacianPyramid(img, numOfLevels, filterParam, out=LI)
+        gaussianPyramid(broadcastMask(mask, np.shape(img)), numOfLevels, filterParam, out=GW)
+        # LS += GW * LI and den += GW, all the levels at once
+        den.data += GW.data
+        LI.data *= GW.data
+        LS.data += LI.data
+    if LS is None:
+        raise ValueError('no images to blend')
+    # where no image has weight the result is 0
+    np.divide(LS.data, den.data, out=LS.data, where=den.data != 0)
+    return imgFromLaplacianPyramid(LS, numOfLevels, filterParam)
+
+
+class Blender:
+    """
+    imgBlending of many frames with the same mask, e.g. video. The Gaussian
+    pyramid of the mask is built once, and when one of the sources is a static
+    background its Laplacian pyramid, already weighted by 1 - mask, is built
+    once as well, so every frame costs only its own Laplacian pyramid, the
+    blend and the collapse. All the pyramids are kept in buffers reused by
+    all the frames.
+    """
+
+    def __init__(self, blendingMask, numOfLevels, filterParam, background=None,
+                 shape=None):
+        """
+        :param blendingMask: the mask, the weight of the frames
+        :param background: static second image (weight 1 - mask), or None to
+        give the second image with every frame
+        :param shape: shape of the frames, needed only for color frames with a
+        mask of rows and columns and no background
+        """
+        self.numOfLevels = numOfLevels
+        self.filterParam = filterParam
+        if shape is None:
+            shape = np.shape(background) if background is not None else np.shape(blendingMask)
+        self.GM = gaussianPyramid(broadcastMask(blendingMask, shape), numOfLevels, filterParam)
+        self.LA = Pyramid(shape, numOfLevels)
+        self.LB = Pyramid(shape, numOfLevels)
+        self.background = None
+        if background is not None:
+            # (1 - GM) * LB of the background
+            self.background = laplacianPyramid(background, numOfLevels, filterParam)
+            self.background.data *= 1 - self.GM.data
+
+    def process(self, frame, other=None, out=None):
+        """
+        :param frame: the image of weight mask
+        :param other: the image of weight 1 - mask, only without a static
+        background
+        :param out: preallocated float array for the result
+        :return: the blended image
+        """
+        LA = laplacianPyramid(frame, self.numOfLevels, self.filterParam, out=self.LA)
+        if self.background is not None:
+            # LS = GM * LA + (1 - GM) * LB
+            LA.data *= self.GM.data
+            LA.data += self.background.data
+        else:
+            if other is None:
+                raise ValueError('other image is needed without a static background')
+            LB = laplacianPyramid(other, self.numOfLevels, self.filterParam, out=self.LB)
+            # LS = LB + GM * (LA - LB)
+            LA.data -= LB.data
+            LA.data *= self.GM.data
+            LA.data += LB.data
+        return imgFromLaplacianPyramid(LA, self.numOfLevels, self.filterParam, out)
+
+    def stream(self, frames):
+        # blend every frame of an iterable with the static background
+        for frame in frames:
+            yield self.process(frame)
@@ -33,6 +33,13 @@ def test_1_bonus2 ():
                                 number=100)
         
         print ("Convolution operator running time for 100 runs: " + str (runTime))    
+
+        # float32 with a preallocated output and mirrored borders
+        runTime = timeit.timeit(stmt='ex5.imConv2(img,kernel1D,"reflect",out)', \
+                                setup = 'import cv2; import numpy as np; import ex5; imageName = "./Images/cameraman.tif"; img = cv2.imread(imageName,cv2.IMREAD_GRAYSCALE).astype(np.float32); kernel1D = ex5.getKernel(0.4); out = np.empty(img.shape, np.float32)',
+                                number=100)
+
+        print ("float32 reflect convolution running time for 100 runs: " + str (runTime))
     
     except:
     
@@ -64,6 +71,22 @@ def test_2ab():
     plt.show()
 
 
+def test_2c():
+    imageName = './Images/cameraman.tif'
+    img = cv2.imread(imageName,cv2.IMREAD_GRAYSCALE)
+
+    numOfLevels = 6
+    l_pyr = ex5.laplacianPyramid (img, numOfLevels, filterParam=0.4)
+
+    # quantized storage, memory saving and reconstruction error
+    for bits, step, sparse in [(16, None, False), (8, None, False), (8, None, True), (8, 2.0, True)]:
+        q_pyr = ex5.QuantizedPyramid(l_pyr, numOfLevels, bits, step, sparse)
+        recon = ex5.imgFromLaplacianPyramid(q_pyr, numOfLevels, filterParam=0.4)
+        err = recon - img
+        print ("%d bits, step %s, sparse %s: %.1fx smaller, max error %.2f, rms error %.3f" % \
+               (bits, step, sparse, l_pyr.data.nbytes / float(q_pyr.nbytes), np.abs(err).max(), np.sqrt(np.mean(err ** 2))))
+
+
 def test_3():
     image1Name = './Images/black.tif'
     img1 = cv2.imread(image1Name,cv2.IMREAD_GRAYSCALE)
@@ -98,6 +121,9 @@ if __name__ == "__main__":
     
     # test 2 - Laplacian pyramid forward - backward
     test_2ab()
+
+    # test 2 - quantized Laplacian pyramid
+    test_2c()
     
     
     # test 3 - Image blending
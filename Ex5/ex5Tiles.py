@@ -0,0 +1,170 @@
+# IMPR 2017, IDC
+# ex5 tiles - Laplacian blending of images too large for memory, tile by tile
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import ex5
+
+
+def tiledBlending(img1, img2, blendingMask, numOfLevels, filterParam, out=None,
+                  tileSize=1024, numOfThreads=1, halo=None):
+    """
+    imgBlending of very large images, tile by tile. Every tile is blended in a
+    window with a halo around it that is large enough for the pyramid not to
+    see the borders of the window, so the result is the same as the blend of
+    the whole images, without seams.
+    The windows are aligned to 2^(numOfLevels - 1) pixels so the levels of a
+    window are on the grid of the levels of the whole image, and at every
+    level the samples outside the whole level are zeroed, like the zero
+    borders of reduce and expand.
+    :param img1: first image, array, np.memmap or path of a .npy file (which
+    is memory mapped)
+    :param img2: second image, like img1
+    :param blendingMask: the mask, like img1
+    :param out: preallocated float output (or np.memmap), or path of a .npy
+    file to create, a new array by default
+    :param tileSize: largest size of the tiles, every axis is split into
+    tiles of about the same size, rounded up to the alignment
+    :param numOfThreads: number of tiles blended at the same time
+    :param halo: width of the halo, by default haloSize(numOfLevels)
+    :return: the blended image (out)
+    """
+    img1, img2, blendingMask = (openImage(img) for img in (img1, img2, blendingMask))
+    shape = img1.shape
+    if isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=float, shape=shape)
+    elif out is None:
+        out = np.empty(shape)
+    align = 2 ** (numOfLevels - 1)
+    if halo is None:
+        halo = haloSize(numOfLevels)
+    halo = roundUp(halo, align)
+    th, tw = (tileLength(n, tileSize, align) for n in shape[:2])
+    if th >= shape[0] and tw >= shape[1]:
+        # a single tile holding the whole image has nothing outside it
+        halo = 0
+
+    def blendTile(corner):
+        y0, x0 = corner
+        y1, x1 = min(y0 + th, shape[0]), min(x0 + tw, shape[1])
+        # the window of the tile with its halo, with the same size for all
+        # the tiles
+        wy0, wx0 = y0 - halo, x0 - halo
+        wy1, wx1 = y0 + th + halo, x0 + tw + halo
+        windows = [readTile(img, wy0, wy1, wx0, wx1)
+                   for img in (img1, img2, blendingMask)]
+        res = blendWindow(windows[0], windows[1], windows[2], (wy0, wx0), shape,
+                          numOfLevels, filterParam)
+        out[y0:y1, x0:x1] = res[halo:halo + y1 - y0, halo:halo + x1 - x0]
+
+    forTiles(blendTile, shape, (th, tw), numOfThreads)
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+
+def haloSize(numOfLevels):
+    # the reduces, and the expands of building and collapsing, spread the
+    # border of the window by about (radius + 1) pixels of the coarsest level
+    # (the smallest halo that gives exactly the blend of the whole images)
+    radius = int(ex5.getKernel(0).shape[0] / 2.0)
+    return (radius + 1) * 2 ** (numOfLevels - 1)
+
+
+def tileLength(n, tileSize, align):
+    # the aligned length that splits n into as many tiles as tileSize does,
+    # of about the same length, so the last one is not mostly outside
+    count = -(-n // roundUp(tileSize, align))
+    return roundUp(-(-n // count), align)
+
+
+def roundUp(n, align):
+    return -(-n // align) * align
+
+
+def openImage(img):
+    # .npy files are memory mapped instead of read
+    if isinstance(img, str):
+        return np.load(img, mmap_mode='r')
+    return img
+
+
+def forTiles(func, shape, tileShape, numOfThreads):
+    # call func with the corner (y0, x0) of every tile of an image of the
+    # given shape, in a thread pool, or one after the other
+    corners = [(y0, x0) for y0 in range(0, shape[0], tileShape[0])
+               for x0 in range(0, shape[1], tileShape[1])]
+    if numOfThreads <= 1:
+        for corner in corners:
+            func(corner)
+    else:
+        with ThreadPoolExecutor(numOfThreads) as executor:
+            list(executor.map(func, corners))
+
+
+def readTile(img, y0, y1, x0, x1):
+    # img[y0:y1, x0:x1] as float, where the parts outside the image are zeros
+    tile = np.zeros((y1 - y0, x1 - x0))
+    sy0, sx0 = max(y0, 0), max(x0, 0)
+    sy1, sx1 = min(y1, img.shape[0]), min(x1, img.shape[1])
+    if sy0 < sy1 and sx0 < sx1:
+        tile[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = img[sy0:sy1, sx0:sx1]
+    return tile
+
+
+def blendWindow(a, b, mask, corner, shape, numOfLevels, filterParam):
+    """
+    imgBlending of windows of the images, where the window starts at corner
+    (aligned to 2^(numOfLevels - 1)) of images of the given shape.
+    :return: the blended window
+    """
+    # the part of every level of the window that is inside the whole level
+    extents = []
+    for level, (rows, cols) in enumerate(ex5.levelShapes(shape, numOfLevels)):
+        y0, x0 = corner[0] // 2 ** level, corner[1] // 2 ** level
+        extents.append((-y0, rows - y0, -x0, cols - x0))
+
+    LA = windowLaplacian(a, extents, numOfLevels, filterParam)
+    LB = windowLaplacian(b, extents, numOfLevels, filterParam)
+    GM = windowGaussian(mask, extents, numOfLevels, filterParam)
+    # LS = LB + GM * (LA - LB), all the levels at once
+    LS = LA
+    LS.data -= LB.data
+    LS.data *= GM.data
+    LS.data += LB.data
+
+    # collapse, zeroing the outside of every reconstructed level
+    image = LS[numOfLevels - 1]
+    for i in range(numOfLevels - 1, 0, -1):
+        image = ex5.expand(image, filterParam, LS.shapes[i - 1])
+        image += LS[i - 1]
+        zeroOutside(image, extents[i - 1])
+    return image
+
+
+def windowGaussian(window, extents, numOfLevels, filterParam):
+    G = ex5.Pyramid(window.shape, numOfLevels)
+    G[0] = window
+    for i in range(1, numOfLevels):
+        ex5.reduce(G[i - 1], filterParam, out=G[i])
+        zeroOutside(G[i], extents[i])
+    return G
+
+
+def windowLaplacian(window, extents, numOfLevels, filterParam):
+    L = windowGaussian(window, extents, numOfLevels, filterParam)
+    for i in range(0, numOfLevels - 1):
+        L[i] -= ex5.expand(L[i + 1], filterParam, L.shapes[i])
+        zeroOutside(L[i], extents[i])
+    return L
+
+
+def zeroOutside(level, extent):
+    # zero the samples of level outside rows y0..y1 and columns x0..x1
+    y0, y1, x0, x1 = extent
+    level[:max(y0, 0)] = 0
+    level[max(y1, 0):] = 0
+    level[:, :max(x0, 0)] = 0
+    level[:, max(x1, 0):] = 0
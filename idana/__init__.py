@@ -0,0 +1,83 @@
+# IMPR 2017, IDC
+# idana - the algorithms of all the exercises behind one import
+"""
+The exercise modules stay where they are (Ex0/ex0.py ... Ex5/ex5.py) and
+are imported only when one of their names is first used, so importing idana
+costs almost nothing, and scipy, cv2 and matplotlib are never loaded unless
+a function that needs them is called. The package is installed in place,
+next to the exercise directories, with pip install -e .
+
+    import idana
+    G = idana.gaussianPyramid(img, 6, 0.4)    # imports ex5 now
+    idana.ex4.phaseCorr(a, b)                 # the modules themselves
+"""
+
+import importlib
+import os
+import sys
+
+# the directory of every module, the modules import each other by name
+MODULES = {
+    'ex0': 'Ex0',
+    'ex1': 'Ex1',
+    'ex2': 'Ex2',
+    'ex3': 'Ex3',
+    'ex3Utils': 'Ex3',
+    'ex4': 'Ex4',
+    'ex4Fft': 'Ex4',
+    'ex4Blocks': 'Ex4',
+    'ex5': 'Ex5',
+    'ex5Tiles': 'Ex5',
+}
+
+# the algorithms, by the module that has them
+API = {
+    'ex0': ['retrunRandomMatrixWithMinMax', 'cartesian2polar2D', 'convertRGB2Gray',
+            'rgb2yiq', 'yiq2rgb'],
+    'ex1': ['getSampledImageAtResolution', 'optimalQuantizationImage',
+            'getImageHistogram', 'getConstrastStrechedImage', 'getHistEqImage'],
+    'ex2': ['getAffineTransformation', 'applyAffineTransToImage', 'bilinearInterpolation',
+            'multipleSegmentDefromation', 'imGradSobel'],
+    'ex3': ['HoughCircles', 'bilateralFilter', 'bilateralSweep'],
+    'ex4': ['Fourier1D', 'invFourier1D', 'Fourier1DPolar', 'invFourier1DPolar',
+            'imageUpsampling', 'upsampleImage', 'phaseCorr', 'pyramidPhaseCorr',
+            'PhaseCorrRegistrar', 'imFreqFilter', 'FreqFilterBank', 'imageDeconv',
+            'WienerDeconvolver'],
+    'ex4Fft': ['fft', 'nextFastLen'],
+    'ex4Blocks': ['blockConvolve', 'blockFreqFilter', 'blockDeconv'],
+    'ex5': ['gaussianPyramid', 'laplacianPyramid', 'imgFromLaplacianPyramid', 'reduce',
+            'expand', 'imConv2', 'imgBlending', 'multiBlending', 'Pyramid', 'LazyPyramid',
+            'QuantizedPyramid', 'Blender'],
+    'ex5Tiles': ['tiledBlending'],
+}
+
+NAMES = dict((name, module) for module, names in API.items() for name in names)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importModule(name):
+    # import an exercise module by its name, from its directory
+    path = os.path.join(ROOT, MODULES[name])
+    if not os.path.isdir(path):
+        raise ImportError('%s is not next to idana, install it in place with '
+                          'pip install -e .' % MODULES[name])
+    if path not in sys.path:
+        sys.path.append(path)
+    return importlib.import_module(name)
+
+
+def __getattr__(name):
+    if name in MODULES:
+        module = importModule(name)
+    elif name in NAMES:
+        module = getattr(importModule(NAMES[name]), name)
+    else:
+        raise AttributeError("module 'idana' has no attribute '%s'" % name)
+    # found once, later uses don't get here
+    globals()[name] = module
+    return module
+
+
+def __dir__():
+    return sorted(set(globals()) | set(MODULES) | set(NAMES))
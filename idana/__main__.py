@@ -0,0 +1,5 @@
+import sys
+
+from idana.cli import main
+
+sys.exit(main())
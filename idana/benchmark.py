@@ -0,0 +1,499 @@
+# IMPR 2017, IDC
+# idana benchmark - time, peak memory and correctness of all the algorithms
+"""
+    python -m idana.benchmark [--sizes 256 1024 4096 8192] [--only ex5.]
+                              [--repeat 3] [--history benchmarks.jsonl]
+                              [--baseline FILE] [--tolerance 0.2]
+                              [--no-checks] [--checks-only]
+
+Every public function is timed on synthetic n x n inputs for every size (up
+to the largest size given for it, the pure python per pixel functions only
+run on small images), as the best of --repeat runs, and its peak memory is
+measured by tracemalloc in one more run.
+Every result is appended as one JSON line to the history file, and compared
+with the last result of the same function and size in the baseline (the
+history itself by default): slower or larger by more than --tolerance is
+flagged as a regression.
+The correctness checks compare the fast paths with the reference
+implementations they replace, and fail above their tolerance.
+The exit status is 1 when there are regressions or failed checks.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import idana
+from idana import reference
+
+SIZES = [256, 512, 1024, 2048, 4096, 8192]
+
+# changes smaller than these are noise, not regressions
+MIN_SECONDS = 0.005
+MIN_BYTES = 2 ** 20
+
+
+# inputs
+def image(n, rng):
+    return rng.random((n, n)) * 255
+
+
+def image8(n, rng):
+    return (rng.random((n, n)) * 255).astype(np.uint8)
+
+
+def rgb(n, rng):
+    return (rng.random((n, n, 3)) * 255).astype(np.uint8)
+
+
+def gray3(n, rng):
+    # gray image in 3 equal channels, like the images of ex1
+    return np.repeat(image8(n, rng)[..., np.newaxis], 3, axis=2)
+
+
+def mask(n):
+    m = np.zeros((n, n))
+    m[:, :n // 2] = 1
+    return m
+
+
+def edges(n):
+    # edge image of a circle, for HoughCircles
+    ys, xs = np.mgrid[:n, :n]
+    return (np.abs(np.hypot(ys - n / 2.0, xs - n / 2.5) - n / 8.0) < 0.5).astype(float)
+
+
+def blur(size=15, std=2.0):
+    x = np.arange(size) - size // 2
+    g = np.exp(-x ** 2 / (2 * std ** 2))
+    return np.outer(g, g) / g.sum() ** 2
+
+
+def call(func, *args, **kwargs):
+    return lambda: func(*args, **kwargs)
+
+
+def segments():
+    Qs = [np.array([10., 10.]), np.array([50., 20.])]
+    Ps = [np.array([10., 50.]), np.array([50., 60.])]
+    Qt = [np.array([12., 10.]), np.array([48., 22.])]
+    Pt = [np.array([10., 52.]), np.array([52., 60.])]
+    return Qs, Ps, Qt, Pt
+
+
+def registrar(n, rng):
+    ref = image(n, rng)
+    frames = np.stack([np.roll(ref, (k, 2 * k), (0, 1)) for k in range(4)])
+    return call(idana.PhaseCorrRegistrar(ref).register, frames)
+
+
+def blender(n, rng):
+    b = idana.Blender(mask(n), 6, 0.4, image(n, rng))
+    return call(b.process, image(n, rng))
+
+
+AFFINE = np.array([[1, 0.1, 3], [0.1, 1, 2], [0, 0, 1.]])
+
+# name, largest size, setup(n, rng) that returns the call to time
+CASES = [
+    ('ex0.retrunRandomMatrixWithMinMax', 4096, lambda n, rng: call(idana.ex0.retrunRandomMatrixWithMinMax, n)),
+    ('ex0.cartesian2polar2D', 8192, lambda n, rng: call(idana.ex0.cartesian2polar2D, rng.random((n, 2)))),
+    ('ex0.convertRGB2Gray', 256, lambda n, rng: call(idana.ex0.convertRGB2Gray, rgb(n, rng))),
+    ('ex0.rgb2yiq', 256, lambda n, rng: call(idana.ex0.rgb2yiq, rgb(n, rng) / 255.0)),
+    ('ex0.yiq2rgb', 256, lambda n, rng: call(idana.ex0.yiq2rgb, rgb(n, rng) / 255.0)),
+    ('ex1.getSampledImageAtResolution', 4096,
+     lambda n, rng: call(idana.ex1.getSampledImageAtResolution, (0, 1, 0, 1), 1.0 / n)),
+    ('ex1.optimalQuantizationImage', 256, lambda n, rng: call(idana.ex1.optimalQuantizationImage, gray3(n, rng), 4)),
+    ('ex1.getImageHistogram', 256, lambda n, rng: call(idana.ex1.getImageHistogram, gray3(n, rng))),
+    ('ex1.getConstrastStrechedImage', 256, lambda n, rng: call(idana.ex1.getConstrastStrechedImage, gray3(n, rng))),
+    ('ex1.getHistEqImage', 256, lambda n, rng: call(idana.ex1.getHistEqImage, gray3(n, rng))),
+    ('ex2.getAffineTransformation', 8192,
+     lambda n, rng: call(idana.ex2.getAffineTransformation, rng.random((n, 2)), rng.random((n, 2)))),
+    ('ex2.applyAffineTransToImage', 256, lambda n, rng: call(idana.ex2.applyAffineTransToImage, image8(n, rng), AFFINE)),
+    ('ex2.bilinearInterpolation', 256, lambda n, rng: call(idana.ex2.bilinearInterpolation, image8(n, rng), 10.3, 20.7)),
+    ('ex2.multipleSegmentDefromation', 64,
+     lambda n, rng: call(idana.ex2.multipleSegmentDefromation, image8(n, rng), *(segments() + (0.5, 2)))),
+    ('ex2.imGradSobel', 256, lambda n, rng: call(idana.ex2.imGradSobel, image8(n, rng))),
+    ('ex3.HoughCircles', 1024, lambda n, rng: call(idana.ex3.HoughCircles, edges(n), [n // 8 - 2, n // 8, n // 8 + 2], 100, 10)),
+    ('ex3.bilateralFilter', 2048, lambda n, rng: call(idana.ex3.bilateralFilter, image(n, rng), 2, 20)),
+    ('ex3.bilateralSweep', 1024,
+     lambda n, rng: call(lambda *a: list(idana.ex3.bilateralSweep(*a)), image(n, rng), [(1, 20), (2, 20)], 1)),
+    ('ex4.Fourier1D', 2048, lambda n, rng: call(idana.ex4.Fourier1D, rng.random(n * n))),
+    ('ex4.invFourier1D', 2048, lambda n, rng: call(idana.ex4.invFourier1D, rng.random(n * n) + 0j)),
+    ('ex4.Fourier1DPolar', 1024, lambda n, rng: call(idana.ex4.Fourier1DPolar, rng.random(n * n))),
+    ('ex4.invFourier1DPolar', 1024,
+     lambda n, rng: call(idana.ex4.invFourier1DPolar, idana.ex4.Fourier1DPolar(rng.random(n * n)))),
+    ('ex4.imageUpsampling', 4096, lambda n, rng: call(idana.ex4.imageUpsampling, image(n // 2, rng), (2, 2))),
+    ('ex4.upsampleImage', 8192, lambda n, rng: call(idana.ex4.upsampleImage, image(n // 2, rng), (2, 2))),
+    ('ex4.phaseCorr', 4096, lambda n, rng: call(idana.ex4.phaseCorr, image(n, rng), image(n, rng))),
+    ('ex4.pyramidPhaseCorr', 4096, lambda n, rng: call(idana.ex4.pyramidPhaseCorr, image(n, rng), image(n, rng))),
+    ('ex4.pyramidPhaseCorr (reference pyramid)', 4096,
+     lambda n, rng: call(idana.ex4.pyramidPhaseCorr, idana.ex5.gaussianPyramid(image(n, rng), 4, 0.4), image(n, rng))),
+    ('ex4.PhaseCorrRegistrar', 2048, registrar),
+    ('ex4.imFreqFilter', 4096, lambda n, rng: call(idana.ex4.imFreqFilter, image(n, rng), 10, 50)),
+    ('ex4.FreqFilterBank', 4096, lambda n, rng: call(idana.ex4.FreqFilterBank().apply, image(n, rng), 10, 50)),
+    ('ex4.imageDeconv', 4096, lambda n, rng: call(idana.ex4.imageDeconv, image(n, rng), blur(), 0.01)),
+    ('ex4.WienerDeconvolver', 2048,
+     lambda n, rng: call(lambda G: list(idana.ex4.WienerDeconvolver(blur()).sweep(G, [0.01, 0.1])), image(n, rng))),
+    ('ex4Fft.fft', 2048, lambda n, rng: call(idana.ex4Fft.fft, rng.random(n * n))),
+    ('ex4Fft.nextFastLen', 8192, lambda n, rng: call(idana.ex4Fft.nextFastLen, n * n + 1)),
+    ('ex4Blocks.blockConvolve', 8192, lambda n, rng: call(idana.ex4Blocks.blockConvolve, image(n, rng), blur(5))),
+    ('ex4Blocks.blockFreqFilter', 4096, lambda n, rng: call(idana.ex4Blocks.blockFreqFilter, image(n, rng), 10, 50)),
+    ('ex4Blocks.blockDeconv', 2048, lambda n, rng: call(idana.ex4Blocks.blockDeconv, image(n, rng), blur(), 0.01)),
+    ('ex5.gaussianPyramid', 8192, lambda n, rng: call(idana.ex5.gaussianPyramid, image(n, rng), 6, 0.4)),
+    ('ex5.laplacianPyramid', 8192, lambda n, rng: call(idana.ex5.laplacianPyramid, image(n, rng), 6, 0.4)),
+    ('ex5.imgFromLaplacianPyramid', 8192,
+     lambda n, rng: call(idana.ex5.imgFromLaplacianPyramid, idana.ex5.laplacianPyramid(image(n, rng), 6, 0.4), 6, 0.4)),
+    ('ex5.reduce', 8192, lambda n, rng: call(idana.ex5.reduce, image(n, rng), 0.4)),
+    ('ex5.expand', 8192, lambda n, rng: call(idana.ex5.expand, image(n // 2, rng), 0.4)),
+    ('ex5.imConv2', 8192, lambda n, rng: call(idana.ex5.imConv2, image(n, rng), idana.ex5.getKernel(0.4))),
+    ('ex5.imgBlending', 4096,
+     lambda n, rng: call(idana.ex5.imgBlending, image(n, rng), image(n, rng), mask(n), 6, 0.4)),
+    ('ex5.multiBlending', 4096,
+     lambda n, rng: call(idana.ex5.multiBlending, [image(n, rng) for _ in range(3)],
+                         [rng.random((n, n)) for _ in range(3)], 6, 0.4)),
+    ('ex5.Pyramid', 8192, lambda n, rng: call(idana.ex5.Pyramid, (n, n), 6)),
+    ('ex5.LazyPyramid', 8192,
+     lambda n, rng: call(lambda img: idana.ex5.LazyPyramid(img, 6, 0.4, 0)[5], image(n, rng))),
+    ('ex5.QuantizedPyramid', 4096,
+     lambda n, rng: call(idana.ex5.QuantizedPyramid, idana.ex5.laplacianPyramid(image(n, rng), 6, 0.4), 6, 8, None, True)),
+    ('ex5.Blender', 4096, blender),
+    ('ex5Tiles.tiledBlending', 8192,
+     lambda n, rng: call(idana.ex5Tiles.tiledBlending, image(n, rng), image(n, rng), mask(n), 6, 0.4)),
+]
+
+
+def measure(func, repeat):
+    """
+    :return: the best time of repeat calls of func, and the peak of the
+    memory allocated by one more call
+    """
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = tracemalloc.get_traced_memory()[1] - start
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def caseSizes(maxSize, sizes):
+    # the sizes a case runs at, at least its largest size when all are larger
+    return [n for n in sizes if n <= maxSize] or [maxSize]
+
+
+# correctness checks: name, tolerance of the absolute error, a function
+# returning (result, reference), and optionally the norm of the error (np.max
+# by default). the references are the original implementations kept in
+# idana.reference, or numpy and scipy where there was none. the originals
+# truncated their results to int in places, so those are compared to 1 gray
+# level
+def checkFft():
+    rng = np.random.default_rng(1)
+    xs = [rng.random(n) + 1j * rng.random(n) for n in (64, 97, 360, 1000, 1009 * 13, 1009 * 1013, 1024)]
+    return (np.concatenate([idana.ex4Fft.fft(x) for x in xs]),
+            np.concatenate([np.fft.fft(x) for x in xs]))
+
+
+def checkFourier1D():
+    rng = np.random.default_rng(2)
+    xs = [rng.random(n) for n in (97, 360, 1000)]
+    return (np.concatenate([idana.ex4.Fourier1D(x) for x in xs] + [idana.ex4.invFourier1D(x) for x in xs]),
+            np.concatenate([reference.Fourier1D(x) for x in xs] + [reference.invFourier1D(x) for x in xs]))
+
+
+def checkUpsample():
+    # upsampling is zero padding of the spectrum, like scipy's resample
+    from scipy.signal import resample
+    rng = np.random.default_rng(3)
+    results, references = [], []
+    for shape in [(64, 64), (63, 64), (64, 63)]:
+        img = rng.random(shape) * 200 + 30
+        for factor in [(2, 2), (2, 1), (1, 2), (1, 1), (1.5, 1), (1.17, 1.3)]:
+            res = idana.ex4.upsampleImage(img, factor)
+            ref = resample(resample(img, res.shape[0], axis=0), res.shape[1], axis=1)
+            results.append(res.ravel())
+            references.append(np.abs(ref).ravel())
+    return np.concatenate(results), np.concatenate(references)
+
+
+def checkPhaseCorr():
+    a = image(256, np.random.default_rng(4))[:, :192]
+    b = np.roll(a, (-17, -40), (0, 1))
+    x, y, r = idana.ex4.phaseCorr(a, b)
+    xRef, yRef, rRef = reference.phaseCorr(a, b)
+    pyramid = idana.ex4.pyramidPhaseCorr(idana.ex5.LazyPyramid(a, 4, 0.4), b)
+    return (np.concatenate([[x, y], idana.ex4.pyramidPhaseCorr(a, b), pyramid, r.ravel()]),
+            np.concatenate([[xRef, yRef], [40, 17], [40, 17], rRef.real.ravel()]))
+
+
+def checkImFreqFilter():
+    img = image(128, np.random.default_rng(18))
+    return (np.concatenate([np.ravel(res) for res in idana.ex4.imFreqFilter(img, 10, 40)]),
+            np.concatenate([np.ravel(res) for res in reference.imFreqFilter(img, 10, 40)]))
+
+
+def checkImageDeconv():
+    rng = np.random.default_rng(19)
+    G, H = image(128, rng), blur()
+    return (np.concatenate([idana.ex4.imageDeconv(G, H, k) for k in (0.01, 1e-5)]),
+            np.concatenate([reference.imageDeconv(G, H, k) for k in (0.01, 1e-5)]))
+
+
+def checkBlockConvolve():
+    from scipy.signal import convolve2d
+    img = image(300, np.random.default_rng(5))
+    kernel = np.random.default_rng(6).random((7, 5))
+    return idana.ex4Blocks.blockConvolve(img, kernel, blockSize=64), convolve2d(img, kernel, 'same')
+
+
+def checkBlockFreqFilter():
+    # inside the borders (zero in blockFreqFilter, periodic in the bank)
+    img = image(512, np.random.default_rng(20))[:, :384]
+    return (idana.ex4Blocks.blockFreqFilter(img, 10, 60, blockSize=256)[64:-64, 64:-64],
+            idana.ex4.FreqFilterBank().apply(img, 10, 60, 'gaussian')[64:-64, 64:-64])
+
+
+def checkBlockDeconv():
+    # a smooth image, blurred periodically like imageDeconv assumes, compared
+    # inside the borders (zero in blockDeconv, periodic in imageDeconv)
+    rng = np.random.default_rng(17)
+    spectrum = np.fft.fft2(rng.random((512, 512)))
+    freqs = np.fft.fftfreq(512)
+    spectrum *= np.exp(-(freqs[:, np.newaxis] ** 2 + freqs ** 2) * 2000)
+    img = np.fft.ifft2(spectrum).real
+    img = (img - img.min()) * (255 / (img.max() - img.min()))
+    H = blur()
+    G = np.fft.irfft2(np.fft.rfft2(img) * np.fft.rfft2(H, img.shape), img.shape)
+    return (idana.ex4Blocks.blockDeconv(G, H, 1e-6, blockSize=256)[64:-64, 64:-64],
+            idana.ex4.imageDeconv(G, H, 1e-6)[64:-64, 64:-64])
+
+
+def checkImConv2():
+    from scipy.signal import convolve2d
+    rng = np.random.default_rng(7)
+    square, img = image(128, rng), image(201, rng)[:, :150]
+    k = idana.ex5.getKernel(0.4)
+    padded = np.pad(img, 2, 'reflect')
+    return (np.concatenate([idana.ex5.imConv2(square, k).ravel(), idana.ex5.imConv2(img, k).ravel(),
+                            idana.ex5.imConv2(img, k, 'reflect').ravel()]),
+            np.concatenate([reference.imConv2(square, k).ravel(), convolve2d(img, np.outer(k, k), 'same').ravel(),
+                            convolve2d(padded, np.outer(k, k), 'valid').ravel()]))
+
+
+def checkGaussianPyramid():
+    img = image(256, np.random.default_rng(8))
+    G, GRef = idana.ex5.gaussianPyramid(img, 6, 0.4), reference.gaussianPyramid(img, 6, 0.4)
+    return (np.concatenate([G[i].ravel() for i in range(6)] + [idana.ex5.reduce(img, 0.4).ravel()]),
+            np.concatenate([GRef[i].ravel() for i in range(6)] + [reference.reduce(img, 0.4).ravel()]))
+
+
+def checkExpand():
+    img = image(64, np.random.default_rng(9))
+    return idana.ex5.expand(img, 0.4), reference.expand(img, 0.4)
+
+
+def checkLaplacianPyramid():
+    img = image(256, np.random.default_rng(10))
+    L, LRef = idana.ex5.laplacianPyramid(img, 6, 0.4), reference.laplacianPyramid(img, 6, 0.4)
+    return (np.concatenate([L[i].ravel() for i in range(6)]),
+            np.concatenate([LRef[i].ravel() for i in range(6)]))
+
+
+def checkLaplacian():
+    img = image(201, np.random.default_rng(10))
+    return idana.ex5.imgFromLaplacianPyramid(idana.ex5.laplacianPyramid(img, 6, 0.4), 6, 0.4), img
+
+
+def checkImgBlending():
+    rng = np.random.default_rng(20)
+    a, b, m = image(128, rng), image(128, rng), mask(128)
+    return idana.ex5.imgBlending(a, b, m, 5, 0.4), reference.imgBlending(a, b, m, 5, 0.4)
+
+
+def checkColorPyramid():
+    img = rgb(129, np.random.default_rng(11))
+    G = idana.ex5.laplacianPyramid(img, 5, 0.4)
+    return (np.concatenate([G[4][..., c] for c in range(3)]),
+            np.concatenate([idana.ex5.laplacianPyramid(img[..., c], 5, 0.4)[4] for c in range(3)]))
+
+
+def checkTiledBlending():
+    rng = np.random.default_rng(12)
+    a, b, m = image(300, rng), image(300, rng), mask(300)
+    return (idana.ex5Tiles.tiledBlending(a, b, m, 5, 0.4, tileSize=64),
+            idana.ex5.imgBlending(a, b, m, 5, 0.4))
+
+
+def checkBlender():
+    rng = np.random.default_rng(13)
+    a, b, m = image(200, rng), image(200, rng), mask(200)
+    return idana.ex5.Blender(m, 5, 0.4, b).process(a), idana.ex5.imgBlending(a, b, m, 5, 0.4)
+
+
+def checkMultiBlending():
+    rng = np.random.default_rng(14)
+    images = [np.full((128, 128), 7.0)] * 3
+    return idana.ex5.multiBlending(images, [rng.random((128, 128)) for _ in range(3)], 5, 0.4), images[0]
+
+
+def checkQuantized():
+    img = image(128, np.random.default_rng(15))
+    Q = idana.ex5.QuantizedPyramid(idana.ex5.laplacianPyramid(img, 5, 0.4), 5, 16)
+    return idana.ex5.imgFromLaplacianPyramid(Q, 5, 0.4), img
+
+
+def checkBilateral():
+    img = image(53, np.random.default_rng(16))[:37]
+    return (np.concatenate([idana.ex3.bilateralFilter(img, s, r) for s, r in ((2, 20), (0.5, 10), (1, 50))]),
+            np.concatenate([reference.bilateralFilter(img, s, r) for s, r in ((2, 20), (0.5, 10), (1, 50))]))
+
+
+def checkBilateralParallel():
+    img = image(96, np.random.default_rng(16))
+    sweep = dict(((s, r), res) for s, r, res in idana.ex3.bilateralSweep(img, [(2, 20)], 1))
+    return (np.concatenate([idana.ex3.bilateralFilter(img, 2, 20, numOfWorkers=2), sweep[(2, 20)]]),
+            np.concatenate([idana.ex3.bilateralFilter(img, 2, 20)] * 2))
+
+
+CHECKS = [
+    ('ex4Fft.fft vs np.fft.fft', 1e-9, checkFft),
+    ('ex4.Fourier1D vs direct DFT', 1e-9, checkFourier1D),
+    ('ex4.upsampleImage vs resample', 1e-9, checkUpsample),
+    ('ex4.phaseCorr vs original, shifts', 1e-9, checkPhaseCorr),
+    ('ex4.imFreqFilter vs original', 1e-9, checkImFreqFilter),
+    ('ex4.imageDeconv vs original', 1e-9, checkImageDeconv),
+    ('ex4Blocks.blockConvolve vs convolve2d', 1e-9, checkBlockConvolve),
+    ('ex4Blocks.blockFreqFilter vs FreqFilterBank', 0.01, checkBlockFreqFilter),
+    ('ex4Blocks.blockDeconv vs imageDeconv, mean', 2.5, checkBlockDeconv, np.mean),
+    ('ex5.imConv2 vs original, convolve2d', 1e-9, checkImConv2),
+    ('ex5.gaussianPyramid, reduce vs original', 1e-9, checkGaussianPyramid),
+    ('ex5.expand vs original', 1, checkExpand),
+    ('ex5.laplacianPyramid vs original', 1, checkLaplacianPyramid),
+    ('ex5 Laplacian round trip', 1e-9, checkLaplacian),
+    ('ex5.imgBlending vs original', 2, checkImgBlending),
+    ('ex5 color pyramid vs channels', 0, checkColorPyramid),
+    ('ex5Tiles.tiledBlending vs imgBlending', 1e-9, checkTiledBlending),
+    ('ex5.Blender vs imgBlending', 1e-9, checkBlender),
+    ('ex5.multiBlending of equal images', 1e-9, checkMultiBlending),
+    ('ex5.QuantizedPyramid 16 bits', 0.01, checkQuantized),
+    ('ex3.bilateralFilter vs original', 1, checkBilateral),
+    ('ex3 bilateral workers and sweep', 0, checkBilateralParallel),
+]
+
+
+def runChecks(only=None):
+    """
+    :return: (name, error, passed) of every check
+    """
+    results = []
+    for entry in CHECKS:
+        name, tolerance, check = entry[:3]
+        norm = entry[3] if len(entry) > 3 else np.max
+        if only and only not in name:
+            continue
+        result, reference = check()
+        result, reference = np.asarray(result), np.asarray(reference)
+        if result.shape != reference.shape:
+            results.append((name, np.inf, False))
+            continue
+        error = norm(np.abs(result - reference))
+        results.append((name, error, error <= tolerance))
+    return results
+
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=idana.ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def readHistory(path):
+    # the last record of every (case, size)
+    last = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    last[(record['case'], record['size'])] = record
+    return last
+
+
+def compare(record, base, tolerance):
+    # the regressions of record against the baseline record
+    flags = []
+    if base is None:
+        return flags
+    if (record['seconds'] > base['seconds'] * (1 + tolerance)
+            and record['seconds'] - base['seconds'] > MIN_SECONDS):
+        flags.append('time x%.2f' % (record['seconds'] / base['seconds']))
+    if (record['peakBytes'] > base['peakBytes'] * (1 + tolerance)
+            and record['peakBytes'] - base['peakBytes'] > MIN_BYTES):
+        flags.append('memory x%.2f' % (record['peakBytes'] / max(base['peakBytes'], 1)))
+    return flags
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmarks of the idana algorithms')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--only', help='run only the cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--history', default='benchmarks.jsonl',
+                        help='JSON lines file the results are appended to')
+    parser.add_argument('--baseline', help='JSON lines file to compare with, the history by default')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown or memory growth')
+    parser.add_argument('--no-checks', action='store_true')
+    parser.add_argument('--checks-only', action='store_true')
+    args = parser.parse_args(argv)
+
+    failed = 0
+    if not args.no_checks:
+        for name, error, passed in runChecks(args.only):
+            failed += not passed
+            print('check %-40s error %.2e  %s' % (name, error, 'ok' if passed else 'FAILED'))
+    if args.checks_only:
+        return 1 if failed else 0
+
+    baseline = readHistory(args.baseline or args.history)
+    commit = gitCommit()
+    regressions = 0
+    rng = np.random.default_rng(0)
+    with open(args.history, 'a') as history:
+        for name, maxSize, setup in CASES:
+            if args.only and args.only not in name:
+                continue
+            for n in caseSizes(maxSize, args.sizes):
+                # the pure python functions with random starts are repeatable
+                np.random.seed(0)
+                seconds, peak = measure(setup(n, rng), args.repeat)
+                record = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit,
+                          'case': name, 'size': n, 'seconds': seconds, 'peakBytes': peak}
+                history.write(json.dumps(record) + '\n')
+                history.flush()
+                flags = compare(record, baseline.get((name, n)), args.tolerance)
+                regressions += bool(flags)
+                print('%-36s %5d %10.2f ms %9.1f MB  %s' % (name, n, seconds * 1000, peak / 2.0 ** 20,
+                                                            'REGRESSION ' + ', '.join(flags) if flags else ''))
+    print('%d regressions, %d failed checks' % (regressions, failed))
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
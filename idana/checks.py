@@ -0,0 +1,85 @@
+# IMPR 2017, IDC
+# idana checks - cold import time, and no heavy modules loaded on import
+"""
+    python -m idana.checks [--repeat 5] [--budget 50]
+
+Every statement is run in a new interpreter (a cold import, like a newly
+spawned worker), its best time of --repeat runs is reported, and the check
+fails when `import idana` takes more than --budget milliseconds, or when any
+statement loads one of the heavy modules. The interpreters run outside the
+repository, so idana has to be installed (pip install -e .).
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+
+# loaded only by the functions that need them
+HEAVY = ('scipy', 'cv2', 'matplotlib')
+
+CHILD = '''
+import sys, time
+t = time.perf_counter()
+%s
+t = time.perf_counter() - t
+print(t)
+print(','.join(m for m in %r if m in sys.modules))
+'''
+
+STATEMENTS = [
+    # what the numbers are compared to
+    ('numpy (reference)', 'import numpy', False),
+    ('idana', 'import idana', True),
+    ('idana.ex5', 'import idana; idana.ex5', False),
+    ('all the algorithms', 'import idana\nfor name in idana.NAMES: getattr(idana, name)', False),
+]
+
+
+def coldImport(statement, repeat=5):
+    """
+    :return: the best time in seconds of the statement in a new interpreter,
+    and the heavy modules it loaded
+    """
+    best, heavy = None, []
+    for _ in range(repeat):
+        # outside the repository, idana has to be installed (pip install -e .)
+        # like for any other process that imports it
+        res = subprocess.run([sys.executable, '-c', CHILD % (statement, HEAVY)],
+                             cwd=tempfile.gettempdir(), capture_output=True, text=True)
+        if res.returncode != 0:
+            raise RuntimeError(res.stderr.strip().split('\n')[-1])
+        lines = res.stdout.strip().split('\n')
+        t = float(lines[0])
+        best = t if best is None else min(best, t)
+        heavy = [m for m in lines[1].split(',') if m] if len(lines) > 1 else []
+    return best, heavy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='cold import checks of idana')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=50.0,
+                        help='milliseconds allowed for import idana')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for name, statement, budgeted in STATEMENTS:
+        try:
+            t, heavy = coldImport(statement, args.repeat)
+        except RuntimeError as e:
+            failed = True
+            print('%-22s %11s  %s' % (name, '-', e))
+            continue
+        problems = []
+        if heavy and not name.endswith('(reference)'):
+            problems.append('loaded ' + ', '.join(heavy))
+        if budgeted and t * 1000 > args.budget:
+            problems.append('over %.0f ms' % args.budget)
+        failed = failed or bool(problems)
+        print('%-22s %8.1f ms  %s' % (name, t * 1000, '; '.join(problems) or 'ok'))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
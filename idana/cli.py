@@ -0,0 +1,221 @@
+# IMPR 2017, IDC
+# idana cli - run algorithms over directories of images, without a display
+"""
+    python -m idana INPUT [INPUT ...] -a STEP [-a STEP ...] -o OUTDIR
+                    [--format png|npy] [--workers N] [--color]
+                    [--normalize] [--skip-existing]
+    python -m idana --list
+
+INPUT is an image or .npy file, a directory (all its images) or a glob
+pattern like 'archive/**/*.jpg'. Every STEP is an algorithm of idana with
+its arguments after the image, written like the arguments of a call, and
+the steps run one after the other on every image:
+
+    python -m idana scans/ -a "bilateralFilter(2, 20)" -a "imGradSobel" -o out
+    python -m idana 'frames/*.png' -a "upsampleImage((2, 2))" --format npy -o big
+
+Images are read as grayscale (RGB with --color). When a step returns a
+tuple, like imageUpsampling, its first element goes on. Every output keeps
+the path of its image relative to the directory (or the part of the glob
+pattern before its first wildcard) it was found in. The images are
+split between --workers processes, and the time of every image and the
+total throughput are reported.
+"""
+
+import argparse
+import ast
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import idana
+
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.npy')
+
+
+def parseStep(text):
+    """
+    :param text: an algorithm name with optional arguments, e.g.
+    "bilateralFilter(2, 20)" or "laplacianPyramid(numOfLevels=6, filterParam=0.4)"
+    :return: (name, args, kwargs)
+    """
+    if '(' not in text:
+        text += '()'
+    try:
+        call = ast.parse(text.strip(), mode='eval').body
+        if not isinstance(call, ast.Call) or not isinstance(call.func, ast.Name):
+            raise ValueError
+        args = [ast.literal_eval(arg) for arg in call.args]
+        kwargs = dict((kw.arg, ast.literal_eval(kw.value)) for kw in call.keywords)
+    except (SyntaxError, ValueError):
+        raise ValueError('bad step %r, expected name(arguments)' % text)
+    if call.func.id not in idana.NAMES:
+        raise ValueError('unknown algorithm %r, see --list' % call.func.id)
+    return call.func.id, args, kwargs
+
+
+def findInputs(inputs):
+    """
+    :return: (path, root) of the files of every file, directory and glob
+    pattern, in order, once. root is the directory the output path is taken
+    relative to: the directory itself, the part of the pattern before its
+    first wildcard, or the directory of a file
+    """
+    files, seen = [], set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            root = pattern
+            matches = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        else:
+            root = patternRoot(pattern)
+            matches = sorted(glob.glob(pattern, recursive=True))
+        for f in matches:
+            if os.path.isfile(f) and f.lower().endswith(EXTENSIONS) and f not in seen:
+                seen.add(f)
+                files.append((f, root))
+    return files
+
+
+def patternRoot(pattern):
+    parts = pattern.split(os.sep)
+    for i, part in enumerate(parts):
+        if any(c in part for c in '*?['):
+            return os.sep.join(parts[:i])
+    return os.path.dirname(pattern)
+
+
+def readImage(path, color):
+    if path.lower().endswith('.npy'):
+        return np.load(path)
+    import cv2
+    img = cv2.imread(path, cv2.IMREAD_COLOR if color else cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise IOError('cannot read %s' % path)
+    if color:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return img
+
+
+def writeImage(path, img, normalize):
+    img = np.asarray(img)
+    if path.endswith('.npy'):
+        np.save(path, img)
+        return
+    import cv2
+    if img.dtype == bool:
+        img = img * 255
+    elif normalize:
+        lo, hi = img.min(), img.max()
+        img = (img - lo) * (255.0 / (hi - lo)) if hi > lo else img * 0
+    img = np.clip(np.round(img), 0, 255).astype(np.uint8)
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    if not cv2.imwrite(path, img):
+        raise IOError('cannot write %s' % path)
+
+
+def runSteps(img, steps):
+    for name, args, kwargs in steps:
+        img = getattr(idana, name)(img, *args, **kwargs)
+        if isinstance(img, tuple):
+            img = img[0]
+    return img
+
+
+def outputPath(path, root, outDir, fmt):
+    # the path relative to its input root, under outDir
+    name = os.path.splitext(os.path.relpath(path, root or os.curdir))[0]
+    return os.path.join(outDir, name + '.' + fmt)
+
+
+def processImage(job):
+    """
+    run the steps on one image and write the result
+    :param job: (path, output path, steps, color, normalize)
+    :return: (path, seconds of the steps, number of pixels, error or None)
+    """
+    path, outPath, steps, color, normalize = job
+    try:
+        img = readImage(path, color)
+        t = time.perf_counter()
+        res = runSteps(img, steps)
+        t = time.perf_counter() - t
+        if isinstance(res, idana.ex5.Pyramid):
+            if not outPath.endswith('.npy'):
+                raise ValueError('pyramids can only be written as .npy')
+            res.save(outPath)
+        else:
+            writeImage(outPath, res, normalize)
+        return path, t, img.shape[0] * img.shape[1], None
+    except Exception as e:
+        return path, 0.0, 0, '%s: %s' % (type(e).__name__, e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m idana',
+                                     description='run idana algorithms over images')
+    parser.add_argument('inputs', nargs='*', help='image files, directories or glob patterns')
+    parser.add_argument('-a', '--apply', action='append', default=[], metavar='STEP',
+                        help='algorithm and its arguments, e.g. "bilateralFilter(2, 20)"')
+    parser.add_argument('-o', '--out', default='.', help='output directory')
+    parser.add_argument('--format', default='png', choices=['png', 'npy'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--color', action='store_true', help='read the images as RGB')
+    parser.add_argument('--normalize', action='store_true',
+                        help='stretch every PNG output to 0..255')
+    parser.add_argument('--skip-existing', action='store_true')
+    parser.add_argument('--list', action='store_true', help='list the algorithms')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for module, names in idana.API.items():
+            print('%-10s %s' % (module, ', '.join(names)))
+        return 0
+    if not args.apply:
+        parser.error('no steps, use -a')
+    try:
+        steps = [parseStep(step) for step in args.apply]
+    except ValueError as e:
+        parser.error(str(e))
+    files = findInputs(args.inputs)
+    if not files:
+        parser.error('no images found')
+
+    outputs = {}
+    for path, root in files:
+        outPath = outputPath(path, root, args.out, args.format)
+        if outPath in outputs:
+            parser.error('%s and %s would both be written to %s' % (outputs[outPath], path, outPath))
+        outputs[outPath] = path
+    jobs = []
+    for outPath, path in outputs.items():
+        if not (args.skip_existing and os.path.exists(outPath)):
+            os.makedirs(os.path.dirname(outPath) or os.curdir, exist_ok=True)
+            jobs.append((path, outPath, steps, args.color, args.normalize))
+
+    start = time.perf_counter()
+    failed, pixels = 0, 0
+    if args.workers <= 1:
+        results = map(processImage, jobs)
+    else:
+        executor = ProcessPoolExecutor(args.workers)
+        results = executor.map(processImage, jobs)
+    for path, t, n, error in results:
+        if error:
+            failed += 1
+            print('%s  FAILED %s' % (path, error), file=sys.stderr)
+        else:
+            pixels += n
+            print('%s  %.1f ms' % (path, t * 1000))
+    if args.workers > 1:
+        executor.shutdown()
+    total = time.perf_counter() - start
+    done = len(jobs) - failed
+    print('%d images (%d skipped, %d failed) in %.2f s, %.2f images/s, %.2f Mpixels/s' % (
+        done, len(files) - len(jobs), failed, total, done / total if total else 0,
+        pixels / 1e6 / total if total else 0))
+    return 1 if failed else 0
@@ -0,0 +1,273 @@
+# IMPR 2017, IDC
+# idana profiling - opt-in timing and memory of every call into the algorithms
+"""
+    from idana import profiling
+    with profiling.Profiler(memory=True) as prof:
+        idana.imgBlending(a, b, mask, 6, 0.4)
+    print(prof.summary())
+    prof.saveTrace('trace.json')      # open in chrome://tracing or Perfetto
+
+    python -m idana.profiling [--memory] [--trace trace.json] script.py [args]
+
+While a profiler is enabled, every function of the exercise modules (and
+every public method of their classes) is replaced by a wrapper that records
+its wall time, CPU time, the shapes and bytes of its array arguments, and
+with memory=True the peak bytes it allocated (by tracemalloc, which slows
+numpy code down noticeably). Calls between the modules are recorded too, so
+the summary shows both the total and the self time (without the recorded
+calls it made) of every stage.
+Disabled, the original functions are put back and nothing is left to cost
+anything. Work done in other processes (bilateralFilter with numOfWorkers)
+is only seen as the time of the call that waits for it.
+"""
+
+import argparse
+import functools
+import inspect
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+
+import idana
+
+# trace events kept for saveTrace, the summary counts all the calls
+MAX_EVENTS = 10 ** 6
+
+# the profiler whose wrappers are installed
+active = None
+
+
+class Stat:
+    # the totals of one function
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.self = 0.0
+        self.maxWall = 0.0
+        self.inBytes = 0
+        self.allocated = 0
+        self.shapes = {}
+
+
+class Frame:
+    # a call in progress
+    def __init__(self, start, memory):
+        self.start = start
+        self.children = 0.0
+        self.memoryStart = memory
+        self.peak = memory
+
+
+class Profiler:
+    """
+    records the calls into the exercise modules between enable() and
+    disable(), or inside a with block.
+    """
+
+    def __init__(self, modules=None, memory=False):
+        """
+        :param modules: names of the modules to instrument (see
+        idana.MODULES), all of them by default
+        :param memory: record the peak bytes allocated by every call
+        """
+        self.modules = list(modules or idana.MODULES)
+        self.memory = memory
+        self.stats = {}
+        self.events = []
+        self.patched = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.origin = None
+        self.startedTracing = False
+
+    def enable(self):
+        global active
+        if active is not None:
+            raise RuntimeError('another profiler is enabled')
+        active = self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.startedTracing = True
+        if self.origin is None:
+            self.origin = time.perf_counter()
+
+        modules = [idana.importModule(name) for name in self.modules]
+        wrappers = {}
+        for module in modules:
+            for name, obj in list(vars(module).items()):
+                if inspect.isfunction(obj) and obj.__module__ == module.__name__ \
+                        and not name.startswith('_'):
+                    wrappers[obj] = self.wrap(obj, module.__name__ + '.' + name)
+                elif inspect.isclass(obj) and obj.__module__ == module.__name__:
+                    for method, func in list(vars(obj).items()):
+                        if inspect.isfunction(func) and (method == '__init__' or not method.startswith('_')):
+                            wrapper = self.wrap(func, '%s.%s.%s' % (module.__name__, name, method))
+                            self.patch(obj, method, wrapper)
+        # every name bound to an instrumented function, also the ones
+        # imported into other modules and the ones idana already found
+        for namespace in modules + [idana]:
+            for name, obj in list(vars(namespace).items()):
+                if inspect.isfunction(obj) and obj in wrappers:
+                    self.patch(namespace, name, wrappers[obj])
+        return self
+
+    def disable(self):
+        global active
+        for owner, name, original in reversed(self.patched):
+            setattr(owner, name, original)
+        self.patched = []
+        # idana keeps the names it finds, also the wrappers it found while
+        # this was enabled
+        for name, obj in list(vars(idana).items()):
+            if hasattr(obj, 'profiled'):
+                setattr(idana, name, obj.profiled)
+        if self.startedTracing:
+            tracemalloc.stop()
+            self.startedTracing = False
+        if active is self:
+            active = None
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    def reset(self):
+        self.stats = {}
+        self.events = []
+        self.origin = time.perf_counter()
+
+    def patch(self, owner, name, wrapper):
+        self.patched.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, wrapper)
+
+    def wrap(self, func, name):
+        profiler = self
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stack = profiler.stack()
+            memory = profiler.tracedMemory(stack)
+            frame = Frame(time.perf_counter(), memory)
+            stack.append(frame)
+            cpu = time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                cpu = time.thread_time() - cpu
+                end = time.perf_counter()
+                stack.pop()
+                profiler.record(name, frame, end, cpu, args, kwargs, stack)
+        wrapper.profiled = func
+        return wrapper
+
+    def stack(self):
+        # the calls in progress in this thread
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def tracedMemory(self, stack):
+        if not self.memory:
+            return 0
+        current, peak = tracemalloc.get_traced_memory()
+        # the peak is reset for the new call, keep the caller's peak so far
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def record(self, name, frame, end, cpu, args, kwargs, stack):
+        wall = end - frame.start
+        allocated = 0
+        if self.memory:
+            peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+            allocated = peak - frame.memoryStart
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        if stack:
+            stack[-1].children += wall
+
+        shapes, inBytes = [], 0
+        for arg in list(args) + list(kwargs.values()):
+            if hasattr(arg, 'shape') and hasattr(arg, 'nbytes'):
+                shapes.append(tuple(arg.shape))
+                inBytes += arg.nbytes
+
+        key = ' '.join('x'.join(str(d) for d in s) for s in shapes)
+        # the threads of forTiles, forFrames and bilateralSweep record too
+        with self.lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = Stat()
+            stat.calls += 1
+            stat.wall += wall
+            stat.cpu += cpu
+            stat.self += wall - frame.children
+            stat.maxWall = max(stat.maxWall, wall)
+            stat.inBytes += inBytes
+            stat.allocated = max(stat.allocated, allocated)
+            stat.shapes[key] = stat.shapes.get(key, 0) + 1
+
+            if len(self.events) < MAX_EVENTS:
+                self.events.append({
+                    'name': name, 'cat': name.split('.')[0], 'ph': 'X',
+                    'ts': (frame.start - self.origin) * 1e6, 'dur': wall * 1e6,
+                    'pid': os.getpid(), 'tid': threading.get_ident(),
+                    'args': {'cpu ms': cpu * 1000, 'shapes': key, 'input bytes': inBytes,
+                             'allocated bytes': allocated}})
+
+    def summary(self, sortBy='self', limit=None):
+        """
+        :param sortBy: 'self', 'wall', 'cpu' or 'calls'
+        :return: table of the recorded functions, the largest first
+        """
+        stats = sorted(self.stats.items(), key=lambda item: -getattr(item[1], sortBy))
+        lines = ['%-40s %8s %11s %11s %11s %11s %10s %10s  %s' % (
+            'function', 'calls', 'self ms', 'wall ms', 'cpu ms', 'max ms',
+            'in MB', 'peak MB', 'most common shapes')]
+        for name, stat in stats[:limit]:
+            shapes = max(stat.shapes, key=stat.shapes.get) if stat.shapes else ''
+            lines.append('%-40s %8d %11.2f %11.2f %11.2f %11.2f %10.1f %10s  %s' % (
+                name, stat.calls, stat.self * 1000, stat.wall * 1000, stat.cpu * 1000,
+                stat.maxWall * 1000, stat.inBytes / 2.0 ** 20,
+                '%.1f' % (stat.allocated / 2.0 ** 20) if self.memory else '-', shapes))
+        return '\n'.join(lines)
+
+    def saveTrace(self, path):
+        # Chrome trace event format, for chrome://tracing and ui.perfetto.dev
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run a python script with the idana calls profiled')
+    parser.add_argument('--memory', action='store_true', help='record the peak memory of every call')
+    parser.add_argument('--trace', help='write a Chrome trace JSON file')
+    parser.add_argument('--sort', default='self', choices=['self', 'wall', 'cpu', 'calls'])
+    parser.add_argument('script')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    profiler = Profiler(memory=args.memory)
+    try:
+        with profiler:
+            runpy.run_path(args.script, run_name='__main__')
+    finally:
+        print(profiler.summary(args.sort), file=sys.stderr)
+        if args.trace:
+            profiler.saveTrace(args.trace)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
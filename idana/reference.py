@@ -0,0 +1,244 @@
+# IMPR 2017, IDC
+# idana reference - the original implementations the optimised code replaced
+"""
+Copies of the first versions of the algorithms, before they were optimised,
+kept only as references for the correctness checks of idana.benchmark.
+They are slow (per pixel loops, direct DFT), only work on the inputs the
+originals supported (ex5 and imageDeconv need square images, the pyramids
+power of two sizes), and are changed only where they no longer run or
+hold known bugs: numpy.matlib's repmat is np.tile, the Ys of the
+imageDeconv regulariser start at 0 like the fixed version does, the size
+fixes of the Laplacian pyramid (which crashed on odd sizes) are left out,
+and imgFromLaplacianPyramid works on a copy of the pyramid.
+"""
+
+import numpy as np
+
+
+# ex3
+def bilateralFilter(imgNoisy, spatial_std, range_std):
+    M, N = imgNoisy.shape
+    imgNoisy = np.asarray(imgNoisy, dtype=float)
+    newImg = np.zeros(imgNoisy.shape)
+    sigma = int(spatial_std * 3)  # further than that has no influence
+    # create kernel to screen image, instead of going over non-influence pixels
+    kernel = getBilateralKernel(sigma)
+    weights = getWeights(kernel, spatial_std)
+
+    for p in np.ndindex(imgNoisy.shape):
+        # finding coordinates of surrounding pixels using kernel
+        kernelCoordinates = np.int32(np.tile([p], (kernel.shape[0], 1)) + kernel)
+        ys, xs = getXsAndYsFrom(kernelCoordinates, M, N)
+        # calculate Wpq according to bilateral formula
+        Iq = imgNoisy[(ys, xs)]
+        Ip = imgNoisy[p]
+        tempWs = (Ip - Iq) ** 2
+        tempWs = np.exp(-tempWs / (2 * range_std ** 2))
+        tempWs = tempWs / tempWs.sum()
+        W = weights * tempWs
+        # calculate new gray value
+        newImg[p] = np.sum(W * Iq) / np.sum(W)
+    newImg = np.asarray(newImg, dtype=int)
+    return newImg
+
+
+def getWeights(kernel, spatial_std):
+    # each surrounding pixel has a different weight according to it's distance
+    tempW = np.abs(np.sum(kernel ** 2, 1))
+    tempW = np.exp(-tempW / 2 * (spatial_std ** 2))
+    weightsS = tempW / tempW.sum()
+    return weightsS
+
+
+def getBilateralKernel(sigma):
+    Ys, Xs = np.meshgrid(np.linspace(-sigma, sigma, 1 + 2 * sigma),
+                         np.linspace(-sigma, sigma, 1 + 2 * sigma))
+    kernel = np.vstack((Ys.flatten(), Xs.flatten())).T
+    return kernel
+
+
+def getXsAndYsFrom(kernelCoordinates, yBound, xBound):
+    ys = kernelCoordinates[:, 0]
+    xs = kernelCoordinates[:, 1]
+    ys[ys < 0] = 0
+    ys[ys > yBound - 1] = yBound - 1
+    xs[xs < 0] = 0
+    xs[xs > xBound - 1] = xBound - 1
+    return ys, xs
+
+
+# ex4
+def Fourier1D(Xn):
+    n = len(Xn)
+    XnFourier = np.ndarray(n, complex)
+
+    # vector of the powers of the exponent
+    exponents = np.repeat(-2.0 / n, n)
+    XnIndices = np.arange(n)
+    exponents = np.multiply(exponents, XnIndices)
+
+    # with each iteration fills an element of the transformed vector
+    for k in np.arange(0, n):
+        realVals = np.cos(np.multiply(exponents, np.pi * k))
+        imagVals = np.sin(np.multiply(exponents, np.pi * k))
+        imagVals = np.multiply(imagVals, 1j)
+
+        realVals = np.multiply(Xn, realVals)
+        imagVals = np.multiply(Xn, imagVals)
+
+        XnFourier[k] = np.sum(realVals) + np.sum(imagVals)
+
+    return XnFourier
+
+
+def invFourier1D(Fn):
+    n = len(Fn)
+    XnInvFourier = np.ndarray(n, complex)
+
+    # vector of the powers of the exponent
+    exponents = np.repeat(np.pi * 2 / n, n)
+    exponents = np.multiply(exponents, np.arange(n))
+
+    # with each iteration fills an element of the 'original' vector
+    for x in np.arange(0, n):
+        cosVals = np.cos(np.multiply(exponents, x))
+        sinVals = np.sin(np.multiply(exponents, x))
+        sinVals = np.multiply(sinVals, 1j)
+
+        cosVals = np.multiply(Fn, cosVals)
+        sinVals = np.multiply(Fn, sinVals)
+
+        XnInvFourier[x] = np.divide(np.sum(cosVals) + np.sum(sinVals), n)
+
+    return XnInvFourier
+
+
+def phaseCorr(ga, gb):
+    Ga = np.fft.fft2(ga)
+    Gb = np.fft.fft2(gb)
+    GbStar = np.conjugate(Gb)
+    tmp = Ga * GbStar
+    R = tmp / np.abs(tmp)
+    r = np.fft.ifft2(R)
+
+    # Determine the location of the peak in r.
+    index = np.argmax(r)
+    y = int(index / r.shape[1])
+    x = int(index % r.shape[1])
+    return x, y, r
+
+
+def imFreqFilter(img, lowThresh, highThresh):
+    Fimg = np.fft.fftshift(np.fft.fft2(img))
+    H = np.zeros(Fimg.shape)
+
+    # create martrix of distance from center
+    xBound, yBound = H.shape
+    xTmp = np.linspace(0, xBound - 1, xBound) - xBound / 2.0
+    yTmp = np.linspace(0, yBound - 1, yBound) - yBound / 2.0
+    us, vs = np.meshgrid(xTmp, yTmp)
+    distanceMatrix = np.sqrt(us ** 2 + vs ** 2)
+
+    # applying pass function over distance
+    H[np.logical_and(lowThresh <= distanceMatrix, distanceMatrix <= highThresh)] = 1
+
+    # applying mask over image
+    filteredImg = np.abs(np.fft.ifft2(Fimg * H))
+
+    return filteredImg, Fimg, H
+
+
+def imageDeconv(G, H, k):
+    FH = np.fft.fft2(H, G.shape)
+    FG = np.fft.fft2(G)
+
+    Hstar = np.conjugate(FH)
+    xBound, yBound = G.shape
+    Xs = np.linspace(0, xBound - 1, xBound)
+    Ys = np.linspace(0, yBound - 1, yBound)
+    us, vs = np.meshgrid(Xs, Ys)
+    tmp = Hstar * FH + k * (us ** 2 + vs ** 2)
+    F = (Hstar / tmp) * FG
+    Fspatial = np.fft.ifft2(F).real
+    # fix shift
+    kernelShape = H.shape
+    Fspatial = np.roll(Fspatial, int(kernelShape[0] / 2.0), 0)
+    Fspatial = np.roll(Fspatial, int(kernelShape[0] / 2.0), 1)
+    return Fspatial
+
+
+# ex5
+def gaussianPyramid(img, numOfLevels, filterParam):
+    G = {0: img}
+    for i in range(1, numOfLevels):
+        G[i] = reduce(G[i - 1], filterParam)
+    return G
+
+
+def getKernel(filterParam):
+    return np.array([0.25 - filterParam / 2.0, 0.25, filterParam, 0.25, 0.25 - filterParam / 2.0])
+
+
+def reduce(image, filterParam):
+    kernel = getKernel(filterParam)
+    # taking only every second pixel of the image after convolution
+    newImage = imConv2(image, kernel)
+    newImage = np.array(newImage[::2, ::2])
+    return newImage
+
+
+def imConv2(img, kernel1D):
+    padding = int(kernel1D.shape[0] / 2.0)
+    imgPad = np.pad(img, padding, 'constant')
+
+    tempResX = np.zeros(imgPad.shape)
+    tempResY = np.zeros(imgPad.shape)
+
+    # separate convolution to rows and columns
+    for i in np.arange(0, kernel1D.shape[0]):
+        window = imgPad[:, i:imgPad.shape[0] - 2 * padding + i]
+        tempResY[:, padding:-padding] = tempResY[:, padding:-padding] + window * kernel1D[i]
+
+    for i in np.arange(0, kernel1D.shape[0]):
+        window = tempResY[i:imgPad.shape[1] - 2 * padding + i, :]
+        tempResX[padding:-padding, :] = tempResX[padding:-padding, :] + window * kernel1D[i]
+
+    return tempResX[padding:img.shape[0] + padding, padding:img.shape[1] + padding]
+
+
+def laplacianPyramid(img, numOfLevels, filterParam):
+    L = {}
+    G = gaussianPyramid(img, numOfLevels, filterParam)
+    for i in range(0, numOfLevels - 1):
+        L[i] = G[i] - expand(G[i + 1], filterParam)
+    L[numOfLevels - 1] = G[numOfLevels - 1]
+    return L
+
+
+def expand(image, filterParam):
+    kernel = getKernel(filterParam)
+    newImage = np.zeros((image.shape[0] * 2, image.shape[1] * 2))
+    newImage[::2, ::2] = image[:, :]
+    # multiply by 4 to normalize after kernel (divides by 4)
+    newImage = 4 * imConv2(newImage, kernel)
+    return np.array(newImage, dtype=int)
+
+
+def imgFromLaplacianPyramid(laplacePrmd, numOfLevels, filterParam):
+    laplacePrmd = dict(laplacePrmd)
+    image = np.zeros(laplacePrmd[0].shape)
+    for i in range(numOfLevels - 1, 0, -1):
+        reconstructedLevel = laplacePrmd[i - 1] + expand(laplacePrmd[i], filterParam)
+        laplacePrmd[i - 1] = reconstructedLevel
+        image = reconstructedLevel
+    return image
+
+
+def imgBlending(img1, img2, blendingMask, numOfLevels, filterParam):
+    LA = laplacianPyramid(img1, numOfLevels, filterParam)
+    LB = laplacianPyramid(img2, numOfLevels, filterParam)
+    GM = gaussianPyramid(blendingMask, numOfLevels, filterParam)
+    LS = {}
+    for key in LA.keys():
+        LS[key] = GM[key] * LA[key] + (1 - GM[key]) * LB[key]
+    return imgFromLaplacianPyramid(LS, numOfLevels, filterParam)